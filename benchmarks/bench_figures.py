@@ -0,0 +1,86 @@
+# Time to build the shared figures as the data grows.
+#
+#   python benchmarks/bench_figures.py [--lineages 25 100 400] [--days 365 730 1460] [--repeat 5]
+#
+# For every combination of lineage count and date span, synthetic datasets
+# (fixtures.py) are seeded into an empty cache directory and a fresh
+# interpreter times wwdash.figures as the callbacks use it:
+#   levels    the wastewater levels chart (bar_chart in the original templates)
+#   monthly   the stacked monthly lineage bars (seq_plot 'monthly')
+#   daily     the stacked daily lineage areas (seq_plot 'daily', 500 points)
+# each built from scratch and serialized to JSON, which is what a callback
+# response costs on a figure cache miss. "first" is the first levels chart,
+# which includes loading the data and building its indexes, and "cached" a
+# lineage_plot served from the figure cache.
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+from fixtures import write_fixtures
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir)
+
+# run in a fresh interpreter, against a cache directory seeded with the fixtures
+MEASURE = """
+import json, sys, time
+import plotly.io as pio
+from wwdash import figures
+
+repeat = int(sys.argv[1])
+
+
+def best_of(fn):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        times.append(time.perf_counter() - start)
+    return min(times), result
+
+
+start = time.perf_counter()
+figures.levels_plot()
+first = time.perf_counter() - start
+results = {'first': first}
+results['levels'], _ = best_of(lambda: pio.to_json(figures.levels_figure(), validate=False))
+for plottype, name in (('monthly', 'NICD_monthly'), ('daily', 'NICD_daily_smoothed')):
+    frame = figures.time_indexed(name)
+    results[plottype], text = best_of(lambda: pio.to_json(
+        figures.lineage_figure(frame, plottype, colors=['#1f77b4', '#ff7f0e'], max_points=500), validate=False))
+    results[plottype + '_bytes'] = len(text)
+figures.lineage_plot('NICD_daily_smoothed', 'daily', max_points=500)
+results['cached'], _ = best_of(lambda: figures.lineage_plot('NICD_daily_smoothed', 'daily', max_points=500))
+print(json.dumps(results))
+"""
+
+
+def measure(lineages, days, repeat):
+    with tempfile.TemporaryDirectory() as cache_dir:
+        write_fixtures(cache_dir, lineages, days, flat=True)
+        env = dict(os.environ, WWDASH_CACHE_DIR=cache_dir, WWDASH_OFFLINE='1')
+        proc = subprocess.run([sys.executable, '-c', MEASURE, str(repeat)], cwd=ROOT, env=env,
+                              capture_output=True, text=True, timeout=600)
+    if proc.returncode:
+        raise RuntimeError(f'measuring {lineages} lineages x {days} days failed:\n{proc.stderr[-2000:]}')
+    return json.loads(proc.stdout.splitlines()[-1])
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Figure construction benchmark on synthetic data.')
+    parser.add_argument('--lineages', type=int, nargs='+', default=[25, 100, 400])
+    parser.add_argument('--days', type=int, nargs='+', default=[365, 730, 1460])
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    print(f'{"lineages":>8} {"days":>6} {"first ms":>9} {"levels ms":>10} {"monthly ms":>11} '
+          f'{"daily ms":>9} {"daily KB":>9} {"cached ms":>10}')
+    for lineages in args.lineages:
+        for days in args.days:
+            r = measure(lineages, days, args.repeat)
+            print(f'{lineages:>8} {days:>6} {r["first"] * 1000:>9.1f} {r["levels"] * 1000:>10.1f} '
+                  f'{r["monthly"] * 1000:>11.1f} {r["daily"] * 1000:>9.1f} {r["daily_bytes"] / 1024:>9.0f} '
+                  f'{r["cached"] * 1000:>10.2f}')
@@ -0,0 +1,236 @@
+# Throughput and latency of a template's callbacks under concurrent load.
+#
+#   python benchmarks/bench_load.py [--template multipage] [--workers 1] [--threads 8]
+#                                   [--clients 8] [--duration 20] [--lineages 60] [--days 730]
+#                                   [--distinct 20]
+#
+# Serves synthetic datasets (fixtures.py) locally, starts the template on
+# them with an empty cache, and has --clients threads post the graph
+# callbacks to /_dash-update-component as fast as they are answered, the way
+# the browser does when someone picks dates, a plot type or a province. The
+# callbacks and their inputs are read from /_dash-dependencies, so every
+# template can be tested. Reports requests per second and the p50 / p99
+# latency per callback, and the size of the responses before and after
+# compression (requests asks for gzip).
+#
+# Each request uses one of --distinct date ranges (0: a new one every time),
+# which sets how often the figure cache is hit. With --workers above 1 the
+# app runs under gunicorn (gthread workers with --threads each), otherwise in
+# werkzeug's threaded server; compare worker counts to size a deployment.
+
+import argparse
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+
+import numpy as np
+import pandas as pd
+import requests
+
+from fixtures import PROVINCES, START, serve, write_fixtures
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir)
+TEMPLATES = ['singlepage_viral_load', 'singlepage_load_and_seq', 'multipage']
+
+# run inside the template directory. The app is imported in every worker, not
+# before forking, so each one starts its own refresher like in production
+SERVE = """
+import sys
+sys.path.insert(0, '.')
+port, workers, threads = map(int, sys.argv[1:4])
+
+
+def load():
+    import app
+    return getattr(app, 'server', None) or app.app.server
+
+
+if workers > 1:
+    from gunicorn.app.base import BaseApplication
+
+    class Server(BaseApplication):
+        def load_config(self):
+            for key, value in dict(bind=f'127.0.0.1:{port}', workers=workers, threads=threads,
+                                   worker_class='gthread', loglevel='warning').items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            return load()
+
+    Server().run()
+else:
+    import logging
+    from werkzeug.serving import make_server
+    logging.getLogger('werkzeug').setLevel(logging.WARNING)  # no line per request
+    make_server('127.0.0.1', port, load(), threaded=True).serve_forever()
+"""
+
+
+def free_port():
+    import socket
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_app(template, port, workers, threads, env):
+    proc = subprocess.Popen([sys.executable, '-c', SERVE, str(port), str(workers), str(threads)],
+                            cwd=os.path.join(ROOT, template), env=env)
+    deadline = time.time() + 120
+    while time.time() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f'{template} exited with {proc.returncode}')
+        try:
+            return proc, requests.get(f'http://127.0.0.1:{port}/_dash-dependencies', timeout=5).json()
+        except requests.ConnectionError:
+            time.sleep(0.2)
+    proc.terminate()
+    raise RuntimeError(f'{template} did not start listening within 120 s')
+
+
+def date_ranges(days, count, rng):
+    first = pd.Timestamp(START)
+    ranges = []
+    for _ in range(count):
+        start = first + pd.Timedelta(days=rng.randrange(0, max(days - 60, 1)))
+        end = min(start + pd.Timedelta(days=rng.randrange(30, max(days, 31))), first + pd.Timedelta(days=days))
+        ranges.append((start.strftime('%Y-%m-%d'), end.strftime('%Y-%m-%d')))
+    return ranges
+
+
+def _outputs(output):
+    # 'graph.figure', or '..a.figure...b.figure..' for a callback with several outputs
+    parts = [dict(zip(('id', 'property'), o.rsplit('.', 1))) for o in output.strip('.').split('...')]
+    return parts if output.startswith('..') else parts[0]
+
+
+def _value(item, dates, rng):
+    prop = item['property']
+    if prop == 'start_date':
+        return dates[0]
+    if prop == 'end_date':
+        return dates[1]
+    if prop == 'relayoutData':
+        return None
+    if prop == 'id':
+        return item['id']
+    if item['id'] == 'plottype':
+        return rng.choice(['epiweek', 'monthly', 'quarterly', 'daily'])
+    if item['id'] == 'province':
+        return rng.choice(PROVINCES)
+    raise KeyError(f'{item["id"]}.{prop}')
+
+
+def callbacks(dependencies, include_all=False):
+    """The server-side callbacks to post, with a function making a request body for each."""
+    chosen = []
+    for dep in dependencies:
+        if dep.get('clientside_function') or not (include_all or '.figure' in dep['output']):
+            continue
+
+        def body(dates, rng, dep=dep):
+            inputs = [dict(i, value=_value(i, dates, rng)) for i in dep['inputs']]
+            return {'output': dep['output'], 'outputs': _outputs(dep['output']), 'inputs': inputs,
+                    'changedPropIds': [f'{inputs[0]["id"]}.{inputs[0]["property"]}'],
+                    'state': [dict(s, value=_value(s, dates, rng)) for s in dep['state']]}
+        try:
+            body(('', ''), random.Random())
+        except KeyError:
+            continue  # an input this script doesn't know how to fill in
+        chosen.append((dep['output'], body))
+    return chosen
+
+
+def client(url, chosen, ranges, days, results, seed, deadline=None, count=None):
+    # posts random callbacks until the deadline, or `count` of them
+    rng = random.Random(seed)
+    session = requests.Session()
+    sent = 0
+    while (time.time() < deadline) if count is None else (sent < count):
+        sent += 1
+        output, body = rng.choice(chosen)
+        dates = rng.choice(ranges) if ranges else date_ranges(days, 1, rng)[0]
+        start = time.perf_counter()
+        try:
+            response = session.post(url, json=body(dates, rng), timeout=60)
+            # the body as decoded, and as sent (compressed, see wwdash/compression.py)
+            ok, size, wire = response.status_code == 200, len(response.content), response.raw.tell()
+        except requests.RequestException:
+            ok, size, wire = False, 0, 0
+        results.append((output, time.perf_counter() - start, ok, size, wire))
+
+
+def report(results, seconds):
+    by_callback = defaultdict(list)
+    for entry in results:
+        by_callback[entry[0]].append(entry)
+    by_callback['all'] = results
+    print(f'{"callback":<48} {"requests":>8} {"errors":>6} {"req/s":>7} {"p50 ms":>8} {"p99 ms":>8} '
+          f'{"max ms":>8} {"KB":>7} {"wire KB":>8}')
+    for output, entries in by_callback.items():
+        latency = np.array([e[1] for e in entries]) * 1000
+        errors = sum(not e[2] for e in entries)
+        size, wire = np.mean([e[3:5] for e in entries], axis=0) / 1024
+        print(f'{output[:48]:<48} {len(entries):>8} {errors:>6} {len(entries) / seconds:>7.1f} '
+              f'{np.percentile(latency, 50):>8.1f} {np.percentile(latency, 99):>8.1f} '
+              f'{latency.max():>8.1f} {size:>7.0f} {wire:>8.0f}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Callback load test on synthetic data.')
+    parser.add_argument('--template', default='singlepage_load_and_seq', choices=TEMPLATES)
+    parser.add_argument('--workers', type=int, default=1, help='gunicorn workers (1: werkzeug, threaded)')
+    parser.add_argument('--threads', type=int, default=8, help='threads per gunicorn worker')
+    parser.add_argument('--clients', type=int, default=8, help='concurrent clients')
+    parser.add_argument('--duration', type=float, default=20, help='seconds of load')
+    parser.add_argument('--warmup', type=int, default=10, help='requests sent one by one before measuring')
+    parser.add_argument('--lineages', type=int, default=60)
+    parser.add_argument('--days', type=int, default=730)
+    parser.add_argument('--distinct', type=int, default=20, help='distinct date ranges (0: all different)')
+    parser.add_argument('--all-callbacks', action='store_true', help='not only the ones that draw a graph')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as data_dir, tempfile.TemporaryDirectory() as cache_dir:
+        write_fixtures(data_dir, args.lineages, args.days, args.seed)
+        fixture_server, data_url = serve(data_dir)
+        env = dict(os.environ, WWDASH_DATA_URL=data_url, WWDASH_CACHE_DIR=cache_dir,
+                   WWDASH_REFRESH_INTERVAL='86400')
+        port = free_port()
+        proc, dependencies = start_app(args.template, port, args.workers, args.threads, env)
+        try:
+            url = f'http://127.0.0.1:{port}/_dash-update-component'
+            chosen = callbacks(dependencies, args.all_callbacks)
+            rng = random.Random(args.seed)
+            ranges = date_ranges(args.days, args.distinct, rng)
+            server = 'werkzeug, threaded' if args.workers == 1 else f'gunicorn, {args.threads} threads each'
+            print(f'{args.template}: {args.workers} worker(s) ({server}), {args.clients} clients, '
+                  f'{args.lineages} lineages x {args.days} days, '
+                  f'{args.distinct or "all different"} date ranges, {len(chosen)} callbacks')
+
+            # the first request loads the data; the rest of the warm-up fills the figure cache a bit
+            warmup = []
+            client(url, chosen, ranges, args.days, warmup, args.seed, count=max(args.warmup, 1))
+            print(f'first request {warmup[0][1] * 1000:.0f} ms (loads the data), '
+                  f'{len(warmup)} warm-up requests in {sum(w[1] for w in warmup):.2f} s')
+
+            results = []
+            deadline = time.time() + args.duration
+            started = time.time()
+            threads = [threading.Thread(target=client, args=(url, chosen, ranges, args.days, results,
+                                                             args.seed + 1000 + i, deadline))
+                       for i in range(args.clients)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            report(results, time.time() - started)
+        finally:
+            proc.terminate()
+            proc.wait()
+            fixture_server.shutdown()
@@ -0,0 +1,78 @@
+# Cost of sending a lineage figure: serialization CPU and bytes on the wire.
+#
+#   python benchmarks/bench_serialize.py [--lineages 25 100 400] [--days 730 1460] [--repeat 5]
+#
+# For the daily lineage chart of synthetic data (fixtures.py) of every size,
+# compares plotly.io.to_json (numbers as JSON lists) with wwdash.serialize
+# (typed arrays, with orjson and with the standard json fallback):
+#   encode ms   building the JSON text from the figure, on a figure cache miss
+#   hit ms      what a figure cache hit costs: parsing the stored text and
+#               Dash encoding the callback response again
+#   KB          the response size, uncompressed, gzipped and brotli-compressed
+#               (brotli only if the package is installed), with the time
+#               compression takes
+
+import argparse
+import gzip
+import json
+import os
+import sys
+import time
+
+import plotly.io as pio
+from plotly.io.json import to_json_plotly
+
+from fixtures import datasets
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+from wwdash import serialize
+from wwdash.compression import BROTLI_QUALITY, GZIP_LEVEL, brotli
+from wwdash.figures import lineage_figure
+from wwdash.normalize import normalize_frame
+
+
+def best_of(fn, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        times.append(time.perf_counter() - start)
+    return min(times) * 1000, result
+
+
+def hit(text, loads):
+    # the figure cache parses its text, and Dash encodes the response around it
+    return to_json_plotly({'multi': True, 'response': {'seq_graph0': {'figure': loads(text)}}})
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Figure serialization and compression benchmark.')
+    parser.add_argument('--lineages', type=int, nargs='+', default=[25, 100, 400])
+    parser.add_argument('--days', type=int, nargs='+', default=[730, 1460])
+    parser.add_argument('--max-points', type=int, default=500)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    encoders = [('plotly.io', lambda fig: pio.to_json(fig, validate=False), json.loads)]
+    if serialize.orjson is not None:
+        encoders.append(('wwdash orjson', lambda fig: serialize.dumps(fig, engine='orjson'), serialize.orjson.loads))
+    encoders.append(('wwdash json', lambda fig: serialize.dumps(fig, engine='json'), json.loads))
+
+    print(f'{"lineages":>8} {"days":>6} {"encoder":<14} {"encode ms":>10} {"hit ms":>8} {"KB":>8} '
+          f'{"gzip KB":>8} {"gzip ms":>8} {"br KB":>8} {"br ms":>8}')
+    for lineages in args.lineages:
+        for days in args.days:
+            frame, _ = normalize_frame('NICD_daily_smoothed', datasets(lineages, days)['NICD_daily_smoothed'])
+            figure = lineage_figure(frame, 'daily', colors=['#1f77b4', '#ff7f0e'], max_points=args.max_points)
+            for name, encode, loads in encoders:
+                encode_ms, text = best_of(lambda: encode(figure), args.repeat)
+                hit_ms, _ = best_of(lambda: hit(text, loads), args.repeat)
+                data = text.encode()
+                gzip_ms, gzipped = best_of(lambda: gzip.compress(data, GZIP_LEVEL), args.repeat)
+                if brotli is not None:
+                    br_ms, brotlied = best_of(lambda: brotli.compress(data, quality=BROTLI_QUALITY), args.repeat)
+                    br = f'{len(brotlied) / 1024:>8.0f} {br_ms:>8.1f}'
+                else:
+                    br = f'{"-":>8} {"-":>8}'
+                print(f'{lineages:>8} {days:>6} {name:<14} {encode_ms:>10.1f} {hit_ms:>8.1f} '
+                      f'{len(data) / 1024:>8.0f} {len(gzipped) / 1024:>8.0f} {gzip_ms:>8.1f} {br}')
@@ -0,0 +1,78 @@
+# Cold start of each template: time to import the app and bind a port.
+#
+#   python benchmarks/bench_startup.py [--templates multipage ...] [--top 15] [--empty-cache]
+#
+# Every template is started in a fresh interpreter with -X importtime, and
+# the slowest imports are listed from its report. Upstream is pointed at an
+# address that never answers (WWDASH_DATA_URL), so any network access during
+# startup shows up as a multi-second stall rather than going unnoticed.
+# Uses the cache in WWDASH_CACHE_DIR, or an empty one with --empty-cache.
+
+import argparse
+import os
+import re
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir)
+TEMPLATES = ['singlepage_viral_load', 'singlepage_load_and_seq', 'multipage']
+
+# run inside the template directory
+STARTUP = """
+import time
+start = time.perf_counter()
+import app
+imported = time.perf_counter()
+from werkzeug.serving import make_server
+server = getattr(app, 'server', None) or app.app.server
+make_server('127.0.0.1', 0, server)
+bound = time.perf_counter()
+print(f'{imported - start:.3f} {bound - start:.3f}')
+"""
+
+LINE = re.compile(r'import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)')
+
+
+def start(template, env):
+    proc = subprocess.run([sys.executable, '-X', 'importtime', '-c', STARTUP],
+                          cwd=os.path.join(ROOT, template), env=env,
+                          capture_output=True, text=True, timeout=600)
+    if proc.returncode:
+        raise RuntimeError(f'{template} failed to start:\n{proc.stderr[-2000:]}')
+    imported, bound = map(float, proc.stdout.split()[-2:])
+    imports = []
+    for line in proc.stderr.splitlines():
+        match = LINE.match(line)
+        if match:
+            self_us, cumulative_us, indent, module = match.groups()
+            imports.append((module, len(indent) // 2, int(self_us), int(cumulative_us)))
+    return imported, bound, imports
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Template startup benchmark.')
+    parser.add_argument('--templates', nargs='+', default=TEMPLATES)
+    parser.add_argument('--top', type=int, default=15, help='slowest imports to list')
+    parser.add_argument('--empty-cache', action='store_true', help='start with an empty cache directory')
+    parser.add_argument('--data-url', default='http://10.255.255.1',
+                        help='upstream during the benchmark (default: an address that never answers)')
+    args = parser.parse_args()
+
+    env = dict(os.environ, WWDASH_DATA_URL=args.data_url, WWDASH_HTTP_TIMEOUT='10')
+    empty = tempfile.TemporaryDirectory() if args.empty_cache else None
+    if empty is not None:
+        env['WWDASH_CACHE_DIR'] = empty.name
+
+    for template in args.templates:
+        imported, bound, imports = start(template, env)
+        print(f'{template}: import {imported * 1000:.0f} ms, listening after {bound * 1000:.0f} ms')
+        # top-level imports by cumulative time, then the slowest modules by their own time
+        top_level = sorted((i for i in imports if i[1] == 1), key=lambda i: -i[3])[:args.top]
+        print(f'  {"top-level import":<40} {"cumulative ms":>14}')
+        for module, _, _, cumulative in top_level:
+            print(f'  {module:<40} {cumulative / 1000:>14.1f}')
+        print(f'  {"module":<40} {"self ms":>14}')
+        for module, _, own, _ in sorted(imports, key=lambda i: -i[2])[:args.top]:
+            print(f'  {module:<40} {own / 1000:>14.1f}')
+        print()
@@ -0,0 +1,68 @@
+# Latency of building the stacked lineage chart vs. number of lineages.
+#
+#   python benchmarks/bench_traces.py [--days 730] [--lineages 10 50 100 250 500 1000]
+#
+# Compares the original one-go.Scatter-per-lineage construction in seq_plot
+# with wwdash.traces.stacked_traces, both including serialization to JSON
+# (which is what a callback response costs). Uses synthetic data only.
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+import plotly.graph_objects as go
+import plotly.io as pio
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+from wwdash.traces import figure_dict, stacked_traces
+
+
+def synthetic_daily(n_lineages, days, seed=0):
+    rng = np.random.default_rng(seed)
+    index = pd.date_range('2022-01-01', periods=days, freq='D')
+    values = rng.random((days, n_lineages))
+    values /= values.sum(axis=1, keepdims=True)
+    return pd.DataFrame(values, index=index, columns=[f'L.{i}' for i in range(n_lineages)])
+
+
+def per_trace(df, colors):
+    fig = go.Figure([go.Scatter(name=sfc, x=df.index, y=df[sfc], marker_color=colors[sfc],
+                                mode='lines', stackgroup='one', fillcolor=colors[sfc],
+                                line=dict(width=0.0)) for sfc in df.columns])
+    fig.update_layout(hovermode='x unified', yaxis_tickformat='.0%', template='none')
+    return pio.to_json(fig, validate=False)
+
+
+def vectorized(df, colors):
+    fig = go.Figure()
+    fig.update_layout(hovermode='x unified', yaxis_tickformat='.0%', template='none')
+    return pio.to_json(figure_dict(fig, stacked_traces(df, colors.reindex(df.columns), kind='area')),
+                       validate=False)
+
+
+def best_of(fn, repeat, *args):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(*args)
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Stacked lineage chart construction benchmark.')
+    parser.add_argument('--days', type=int, default=730)
+    parser.add_argument('--lineages', type=int, nargs='+', default=[10, 50, 100, 250, 500, 1000])
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    print(f'{"lineages":>8} {"per-trace ms":>13} {"vectorized ms":>14} {"speedup":>8}')
+    for n in args.lineages:
+        df = synthetic_daily(n, args.days)
+        colors = pd.Series([f'#{i * 2654435761 % 0xffffff:06x}' for i in range(n)], index=df.columns)
+        slow = best_of(per_trace, args.repeat, df, colors)
+        fast = best_of(vectorized, args.repeat, df, colors)
+        print(f'{n:>8} {slow * 1000:>13.1f} {fast * 1000:>14.1f} {slow / fast:>7.1f}x')
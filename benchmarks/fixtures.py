@@ -0,0 +1,136 @@
+# Synthetic datasets in the same shape as the upstream files, served locally.
+#
+#   python benchmarks/fixtures.py DIR [--lineages 60] [--days 730] [--port 8000]
+#
+# writes every dataset in SOURCES under DIR at its GitHub path and serves DIR,
+# so a template can be run against it with WWDASH_DATA_URL=http://127.0.0.1:8000
+# (and a WWDASH_CACHE_DIR of its own). The benchmarks use it to run without
+# network access at any data size: `lineages` sets the width of the monthly
+# and daily prevalence frames, `days` how far back every dataset goes.
+
+import argparse
+import functools
+import json
+import os
+import sys
+import threading
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.feather as feather
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+from wwdash.cache import SOURCES
+
+PROVINCES = ['Eastern Cape', 'Free State', 'Gauteng', 'KwaZulu-Natal', 'Limpopo',
+             'Mpumalanga', 'North West', 'Northern Cape', 'Western Cape']
+START = '2022-01-01'
+
+
+def prevalence(lineages, days, rng):
+    # every lineage comes and goes in a wave of its own, scaled to add up to 1 every day
+    t = np.arange(days)[:, None]
+    peak = rng.uniform(-60, days + 60, lineages)
+    width = rng.uniform(20, 120, lineages)
+    waves = np.exp(-0.5 * ((t - peak) / width) ** 2) * rng.uniform(0.2, 1, lineages)
+    waves += rng.random((days, lineages)) * 1e-3
+    values = waves / waves.sum(axis=1, keepdims=True)
+    return pd.DataFrame(values, index=pd.date_range(START, periods=days, freq='D'),
+                        columns=[f'L.{i}' for i in range(lineages)])
+
+
+def levels(days, rng, provinces=None):
+    ends = pd.date_range(START, periods=max(days // 7, 1), freq='W-SAT')
+    frames = []
+    for province in provinces or [None]:
+        wave = 1 + np.sin(np.arange(len(ends)) / 8 + rng.uniform(0, 6))
+        frame = pd.DataFrame({
+            'end': ends.strftime('%Y-%m-%d'),
+            'n': rng.poisson(200 * wave + 5),
+            'sum_genomes': 150 * wave * rng.lognormal(0, 0.2, len(ends)),
+        })
+        # not every week has a wastewater sample
+        frame.loc[rng.random(len(ends)) < 0.05, 'sum_genomes'] = np.nan
+        if province is not None:
+            frame['province'] = province
+        frames.append(frame)
+    return pd.concat(frames, ignore_index=True)
+
+
+def exploded(daily, rng, top=8):
+    # one row per province, sampling week and lineage, like merged_data_exploded
+    rows = []
+    for province in PROVINCES:
+        for date in daily.index[::7]:
+            values = daily.loc[date] * rng.lognormal(0, 0.3, daily.shape[1])
+            values = values.nlargest(top)
+            for lineage, abundance in (values / values.sum()).items():
+                rows.append((province, date, lineage, abundance))
+    return pd.DataFrame(rows, columns=['province', 'date', 'lineages', 'abundances'])
+
+
+def datasets(lineages=60, days=730, seed=0):
+    """{name: DataFrame or dict} for every dataset in SOURCES."""
+    rng = np.random.default_rng(seed)
+    daily = prevalence(lineages, days, rng)
+    monthly = daily.resample('MS').mean()
+    monthly = monthly.div(monthly.sum(axis=1), axis=0)
+    return {
+        'rsa_cases_vs_levels': levels(days, rng),
+        'NICD_monthly': monthly,
+        'NICD_daily_smoothed': daily,
+        'provincial_cases_vs_levels': levels(days, rng, PROVINCES),
+        'merged_data_exploded': exploded(daily, rng),
+        'color_map': {name: f'#{i * 2654435761 % 0xffffff:06x}' for i, name in enumerate(daily.columns)},
+    }
+
+
+def write_fixtures(directory, lineages=60, days=730, seed=0, flat=False):
+    """Write the datasets under `directory`, at their GitHub paths.
+
+    flat=True writes them straight into `directory` instead, under the
+    file names a cache directory can be seeded with (see cache.py).
+    """
+    for name, data in datasets(lineages, days, seed).items():
+        path = os.path.join(directory, os.path.basename(SOURCES[name]) if flat else SOURCES[name].lstrip('/'))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        if isinstance(data, dict):
+            with open(path, 'w') as fh:
+                json.dump(data, fh)
+        else:
+            # the wide frames keep their dates in the index (__index_level_0__), like upstream
+            feather.write_feather(pa.Table.from_pandas(data), path)
+    return directory
+
+
+class _Quiet(SimpleHTTPRequestHandler):
+
+    def log_message(self, *args):
+        pass
+
+
+def serve(directory, port=0):
+    """Serve `directory` over HTTP from a daemon thread; returns (server, base url)."""
+    server = ThreadingHTTPServer(('127.0.0.1', port), functools.partial(_Quiet, directory=directory))
+    threading.Thread(target=server.serve_forever, name='fixtures', daemon=True).start()
+    return server, f'http://127.0.0.1:{server.server_address[1]}'
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Write and serve synthetic dashboard datasets.')
+    parser.add_argument('directory')
+    parser.add_argument('--lineages', type=int, default=60)
+    parser.add_argument('--days', type=int, default=730)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--port', type=int, default=8000)
+    args = parser.parse_args()
+
+    write_fixtures(args.directory, args.lineages, args.days, args.seed)
+    server, url = serve(args.directory, args.port)
+    print(f'serving {args.directory} at {url} (WWDASH_DATA_URL={url}), Ctrl-C to stop')
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
@@ -1,7 +1,12 @@
 import dash
-from dash import html, dcc
+from dash import html
 import dash_bootstrap_components as dbc
 from navbar import create_navbar, create_footer
+import os, sys
+
+# the shared data layer (wwdash) lives at the top of the repository
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+from wwdash import compress, data_api, http_cache, instrument, start_refresher
 
 
 NAVBAR = create_navbar()
@@ -15,19 +20,26 @@ app = dash.Dash(__name__,
 
 server = app.server
 
-# coordinate page order
+# /metrics and Server-Timing headers, when WWDASH_METRICS / WWDASH_SERVER_TIMING are set
+instrument(server)
+# brotli/gzip for the callback responses and layout (WWDASH_COMPRESS=0 to turn off)
+compress(server)
+# ETags and Cache-Control, so repeat requests within a data version get a 304 (WWDASH_HTTP_CACHE=0 to turn off)
+http_cache(server)
+# the numbers behind the charts on /api/data, as Arrow, JSON or CSV (WWDASH_DATA_API=0 to leave out)
+data_api(server)
+
+# each page loads the datasets it uses the first time it is shown, after which they are
+# checked for updates in the background (every WWDASH_REFRESH_INTERVAL seconds)
+start_refresher()
+
+# coordinate page order. The page layouts contain no data, so they are shown straight away;
+# each graph has its own loading spinner until its callback has filled it in
 def serve_layout():
-    return dcc.Loading(  
-                       id='loading_page_content',
-                       children = [
-                            html.Div([
-                            NAVBAR,
-                            dash.page_container,
-                            footer])
-                            ],
-                        color='primary',
-                        fullscreen=True
-                       )
+    return html.Div([
+        NAVBAR,
+        dash.page_container,
+        footer])
 
 app.layout = serve_layout
 
@@ -1,25 +1,30 @@
-import pandas as pd
-import json, urllib.request
-import requests
+import os, sys
 
+# the cached data layer (wwdash) is shared by all templates and lives at the top of the repository
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+from wwdash import registry
+
+# each loader returns a read-only view of a local, memory-mapped copy of the data that
+# is shared by all workers on this machine, and only goes to GitHub when that copy is
+# older than WWDASH_CACHE_TTL (see wwdash/cache.py and wwdash/registry.py)
 def load_rsa_cases_and_levels():
-    return pd.read_feather("https://raw.githubusercontent.com/NICD-Wastewater-Genomics/NICD-Dash-Data/main/rsa_cases_vs_levels.feather")
+    return registry.get('rsa_cases_vs_levels')
 
 
 def load_monthly_data():
-    return pd.read_feather("https://raw.githubusercontent.com/NICD-Wastewater-Genomics/NICD-Dash-Data/main/NICD_monthly.feather")
+    return registry.get('NICD_monthly')
 
 
 def load_monthly_data_smoothed():
-    return pd.read_feather("https://raw.githubusercontent.com/NICD-Wastewater-Genomics/NICD-Dash-Data/main/NICD_daily_smoothed.feather")
+    return registry.get('NICD_daily_smoothed')
 
 
 def load_provincial_cases_levels():
-    return pd.read_feather("https://raw.githubusercontent.com/NICD-Wastewater-Genomics/NICD-Dash-Data/main/provincial_cases_vs_levels.feather")
+    return registry.get('provincial_cases_vs_levels')
 
 
 def load_provincial_merged():
-    return pd.read_feather("https://raw.githubusercontent.com/NICD-Wastewater-Genomics/NICD-Dash-Data/main/merged_data_exploded.feather")
+    return registry.get('merged_data_exploded')
 
 def load_color_map():
-    return pd.read_json("https://raw.githubusercontent.com/NICD-Wastewater-Genomics/NICD-Freyja-outputs-/main/scripts/color_map.json",typ='series')
\ No newline at end of file
+    return registry.get('color_map')
@@ -20,6 +20,10 @@ def create_navbar():
                                 dbc.DropdownMenuItem("SARS-CoV-2- Levels", href='/',style = {'font-size':16}),
                                 dbc.DropdownMenuItem(divider=True),
                                 dbc.DropdownMenuItem("SARS-CoV-2- Variants", href='/seq',style = {'font-size':16}),
+                                dbc.DropdownMenuItem(divider=True),
+                                dbc.DropdownMenuItem("SARS-CoV-2- Provinces", href='/provinces',style = {'font-size':16}),
+                                dbc.DropdownMenuItem(divider=True),
+                                dbc.DropdownMenuItem("SARS-CoV-2- Lead time", href='/lead-time',style = {'font-size':16}),
                             ],
                         style={"float":'left','font-size':24}),
                     width={'size':3,'offset':6}),
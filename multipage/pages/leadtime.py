@@ -0,0 +1,100 @@
+import dash
+from dash import html, dcc, Input, Output, callback
+import dash_bootstrap_components as dbc
+from wwdash import background, figures, lead_time, store
+
+#This is to register the page in the dash app
+dash.register_page(__name__, path='/lead-time', name='Lead time')
+
+#The national and provincial cases vs levels files (see load_data.py)
+national = 'rsa_cases_vs_levels'
+provincial = 'provincial_cases_vs_levels'
+province_column = 'province'
+
+#Lags from -max_lag to max_lag weeks are compared
+max_lag = 6
+
+#Bootstrap resamples for the 95% intervals; the choices offered in the page
+bootstrap_choices = {0: 'None', 200: '200 resamples', 1000: '1000 resamples'}
+default_bootstrap = 200
+
+
+def region_options():
+    return [{'label': 'South Africa', 'value': 'national'}] + \
+           [{'label': p, 'value': p} for p in store.values(provincial, province_column)]
+
+
+def lag_results(region, bootstrap):
+    # the figure and its summary; both come from lead times computed once per data version
+    # (wwdash/lag.py), so only the first request for a region and bootstrap runs the resampling
+    name, province = (national, None) if region == 'national' else (provincial, region)
+    result = lead_time(name, province, max_lag, bootstrap)
+    return figures.lag_plot(name, province, max_lag, bootstrap), figures.lead_summary(result)
+
+
+@callback(
+    Output("lag_region", "options"),
+    Input("lag_region", "id"))
+def lag_regions(_):
+    return region_options()
+
+
+#The bootstrap can take a few seconds for every region, so with diskcache installed this runs
+#as a background callback (wwdash/background.py): outside the web worker, with the result kept
+#until the data changes. Without it, it is an ordinary callback
+manager = background.manager(national, provincial)
+
+
+@callback(
+    Output("lag_plot", "figure"),
+    Output("lag_summary", "children"),
+    Input("lag_region", "value"),
+    Input("lag_bootstrap", "value"),
+    background=manager is not None,
+    manager=manager)
+def lag_panel(region, bootstrap):
+    return lag_results(region or 'national', int(bootstrap or 0))
+
+
+def static_figures():
+    # what `python -m wwdash.export` shows: the national lead time, without the bootstrap
+    return {'lag_plot': lag_results('national', 0)[0]}
+
+
+def lag_container():
+    return dbc.Container([
+        dbc.Row(
+            dbc.Col(
+                html.H1(id="H1", children="SARS-CoV-2 Wastewater Surveillance", style={'color': 'white'}),
+                width=12
+            ),
+            style={"textAlign": "center", "paddingTop": 30, "paddingBottom": 30, "backgroundColor": "#A6CE39"}
+        ),
+        html.Div(style={'height': '15px'}),
+        html.P(
+            id="lag_intro",
+            children=['How many weeks changes in wastewater levels come before changes in reported cases: '
+                      'the correlation of the two weekly series when the cases are shifted by each lag'],
+            style={"font-size": 20,"textAlign": "center"}
+        ),
+        html.Div(style={'height': '15px'}),
+        dbc.Row([
+            dbc.Col(dcc.Dropdown(id="lag_region", value='national', clearable=False), width={'size': 3, 'offset': 3}),
+            dbc.Col(dcc.Dropdown(id="lag_bootstrap", value=default_bootstrap, clearable=False,
+                                 options=[{'label': f'Intervals: {label}', 'value': n}
+                                          for n, label in bootstrap_choices.items()]),
+                    width=3),
+        ]),
+        html.Div(style={'height': '25px'}),
+        html.H3(
+            id="H3_lag", children='Lead Time of Wastewater Levels over Cases',
+            style={"textAlign": "center", "marginTop": 10, "marginBottom": 0}
+        ),
+        dbc.Row(
+            dcc.Loading(dcc.Graph(id="lag_plot", config={'displayModeBar': False}), color='primary'),
+            style={"width": "100%", "align-items": "center", 'justify-content': 'center', 'margin': 'auto'}
+        ),
+        html.P(id="lag_summary", style={"font-size": 18, "textAlign": "center"}),
+    ], fluid=True)
+
+layout = lag_container
@@ -0,0 +1,151 @@
+import dash
+from dash import html, dcc, Input, Output, callback, no_update
+import dash_bootstrap_components as dbc
+from wwdash import day, figures, registry, store
+
+#This is to register the page in the dash app
+dash.register_page(__name__, path='/provinces', name='Provinces')
+
+#Specify the start and end dates for filtering your data
+start_date = '2024-06-01'
+end_date =  '2024-12-01'
+
+#How the wastewater levels are smoothed: 'rolling' (5 epiweek average), 'exponential' or 'loess'
+smoother = 'rolling'
+
+#Column names in the provincial files, change these to match your own data
+province_column = 'province'
+sample_date_column = 'date'
+lineage_column = 'lineages'
+abundance_column = 'abundances'
+
+#As on the variants page, lineages below this prevalence are shown together as "Other"
+lineage_threshold = 0.01
+
+
+#Both provincial tables are read through the partitioned store (wwdash/store.py): a graph
+#only reads the province, dates and columns it shows, not the whole table.
+def province_levels():
+    return store.values('provincial_cases_vs_levels', province_column)
+
+
+def province_lineages(province):
+    # the monthly prevalences of one province, computed once per data version from only that
+    # province's samples; the date range is then a slice (see lineage_figure)
+    def build(snap):
+        df = store.query('merged_data_exploded', [sample_date_column, lineage_column, abundance_column],
+                         **{province_column: province})
+        return monthly_prevalence(df)
+    return registry.memo('merged_data_exploded', ('monthly', province), build)
+
+
+def monthly_prevalence(df):
+    # merged_data_exploded has one row per sample and lineage; sum the abundances per
+    # month and lineage in one pivot, then scale every month to add up to 1.
+    # Lineages are categoricals (see wwdash/normalize.py), observed=True
+    # keeps the pivot to the ones that occur
+    # (pandas is imported here rather than at the top, so the app starts without it)
+    import pandas as pd
+    if df.empty:
+        # no sequencing data for this province (yet)
+        return pd.DataFrame(index=pd.DatetimeIndex([]))
+    month = pd.to_datetime(df[sample_date_column]).dt.to_period('M').dt.to_timestamp()
+    table = df.assign(month=month.values).pivot_table(index='month', columns=lineage_column,
+                                                      values=abundance_column, aggfunc='sum', fill_value=0.0,
+                                                      observed=True)
+    # months without any abundance are left out, like in the national monthly data
+    table = table[table.sum(axis=1) > 0]
+    table = table.div(table.sum(axis=1), axis=0).astype('float32')
+    table.columns = table.columns.astype(str)
+    table.columns.name = None
+    table.index.name = None
+    return table
+
+
+#The layout is sent without any data in it. The province list and the date bounds are filled
+#in once the page is shown, which then draws the graphs below.
+@callback(
+    Output("province", "options"),
+    Output("province", "value"),
+    Input("province", "id"))
+def province_options(_):
+    provinces = list(province_levels())
+    return provinces, provinces[0] if provinces else no_update
+
+
+figures.date_bounds("province_dates", 'provincial_cases_vs_levels')
+
+
+#Selecting a province redraws both graphs, which are cached per data version, province and dates
+@callback(
+    Output("province_levels", "figure"),
+    Output("province_seq", "figure"),
+    Input("province", "value"),
+    Input("province_dates", "start_date"),
+    Input("province_dates", "end_date"))
+def province_plots(province, start, end):
+    if province is None:
+        return no_update, no_update
+    start, end = day(start, start_date), day(end, end_date)
+    # the same shared figures as the national pages (wwdash/figures.py), for one province
+    levels = figures.levels_plot('provincial_cases_vs_levels', start, end, smoother,
+                                 partition=(province_column, province))
+    # the prevalences are only read and computed if the figure isn't cached yet
+    seq = figures.lineage_plot('merged_data_exploded', 'monthly', start, end, colors='color_map',
+                               threshold=lineage_threshold, variant=province,
+                               frame=lambda: province_lineages(province))
+    return levels, seq
+
+
+def static_figures():
+    # what `python -m wwdash.export` shows: the first province with the default dates
+    province = next(iter(province_levels()), None)
+    if province is None:
+        return {}
+    levels, seq = province_plots(province, start_date, end_date)
+    return {'province_levels': levels, 'province_seq': seq}
+
+
+def province_container():
+    return dbc.Container([
+        dbc.Row(
+            dbc.Col(
+                html.H1(id="H1", children="SARS-CoV-2 Wastewater Surveillance", style={'color': 'white'}),
+                width=12
+            ),
+            style={"textAlign": "center", "paddingTop": 30, "paddingBottom": 30, "backgroundColor": "#A6CE39"}
+        ),
+        html.Div(style={'height': '15px'}),
+        html.P(
+            id="province_intro",
+            children=['Basic info on wastewater surveillance in each province'],
+            style={"font-size": 20,"textAlign": "center"}
+        ),
+        html.Div(style={'height': '15px'}),
+        #The province selector and date range apply to both graphs below
+        dbc.Row([
+            dbc.Col(dcc.Dropdown(id="province", clearable=False), width={'size': 3, 'offset': 3}),
+            dbc.Col(figures.date_picker("province_dates", None, start_date, end_date),
+                    width=3),
+        ]),
+        html.Div(style={'height': '25px'}),
+        html.H3(
+            id="H3_province_levels", children='Provincial SARS-CoV-2 Wastewater Levels',
+            style={"textAlign": "center", "marginTop": 10, "marginBottom": 0}
+        ),
+        dbc.Row(
+            dcc.Loading(dcc.Graph(id="province_levels", config={'displayModeBar': False,'doubleClick': 'reset'}), color='primary'),
+            style={"width": "100%", "align-items": "center", 'justify-content': 'center', 'margin': 'auto'}
+        ),
+        html.Div(style={'height': '25px'}),
+        html.H3(
+            id="H3_province_seq", children='Provincial SARS-CoV-2 Lineage Prevalence',
+            style={"textAlign": "center", "marginTop": 10, "marginBottom": 0}
+        ),
+        dbc.Row(
+            dcc.Loading(dcc.Graph(id="province_seq", config={'displayModeBar': False}), color='primary'),
+            style={"width": "100%", "align-items": "center", 'justify-content': 'center', 'margin': 'auto'}
+        )
+    ], fluid=True)
+
+layout = province_container
@@ -1,13 +1,7 @@
 import dash
-from dash import html, dcc
+from dash import html, dcc, Input, Output, callback, clientside_callback, ctx, no_update
 import dash_bootstrap_components as dbc
-import pandas as pd
-from datetime import date, timedelta
-from dash import html, dcc, Input, Output, callback
-import plotly.graph_objects as go
-from datetime import timedelta
-from load_data import load_monthly_data, load_monthly_data_smoothed, load_rsa_cases_and_levels, load_color_map
-from plotly.subplots import make_subplots
+from wwdash import day, env_flag, figures, registry, zoom_window
 
 #This is to register the page in the dash app
 dash.register_page(__name__, path='/seq')
@@ -16,6 +10,28 @@ dash.register_page(__name__, path='/seq')
 start_date = '2024-06-01'
 end_date =  '2024-12-01'
 
+# Set to True (or WWDASH_CLIENTSIDE_TOGGLE=1) to send the figures of every plottype together to the
+# page and switch between them in the browser: the toggle then costs no server time at all,
+# at the price of a larger first page load.
+clientside_toggle = env_flag('WWDASH_CLIENTSIDE_TOGGLE')
+
+# Lineages that never reach this prevalence in the plotted window are shown together as
+# "Other", which bounds the number of traces sent to the browser (0 shows every lineage).
+lineage_threshold = 0.01
+# Optionally roll lineages up to a parent first, e.g. {'XBB.1.5.1': 'XBB.1.5'}
+lineage_groups = None
+# Each daily trace is sent with at most this many points; zooming in fetches the visible
+# window again at this resolution, so the detail follows what is on screen.
+max_points = 500
+# The views offered for the lineage chart. 'monthly' and 'daily' are the published files; the
+# epiweek and quarterly views are rolled up from the daily data once per refresh (wwdash/rollup.py)
+plottypes = {
+    'epiweek': 'Weekly Trends',
+    'monthly': 'Monthly Trends',
+    'quarterly': 'Quarterly Trends',
+    'daily': 'Smoothed Daily Trends',
+}
+
 #This container creates the overall layout for the page, including the 
 #title, a short intro, radio buttons for selecting the plot type as well as the actual graphs 
 
@@ -44,7 +60,7 @@ def new_container():
             style={"textAlign": "center", "marginTop": 5, "marginBottom": 5}
         ),
         html.Div(style={'height': '15px'}),
-        #This is how to create the radio buttons to choose between the 'Monthly Trends' and 'Smoothed Daily Trends'
+        #This is how to create the radio buttons to choose between the views in plottypes above
         html.Div(
             dbc.RadioItems(
                 id="plottype",
@@ -52,70 +68,86 @@ def new_container():
                 inputClassName="btn-check",
                 labelClassName="btn btn-outline-primary",
                 labelCheckedClassName="active",
-                options=[
-                    {"label": "Monthly Trends", "value": "monthly"},
-                    {"label": "Smoothed Daily Trends", "value": "daily"}
-                ],
+                options=[{"label": label, "value": plottype} for plottype, label in plottypes.items()],
                 value="daily",
                 style={"width": "100%", "justify-content": "flex-end"}
             ),
             style={"marginTop": 0, "marginBottom": 0}
         ),
         html.Div(style={'height': '15px'}),
+        html.Div(figures.date_picker("seq_dates", None, start_date, end_date), style={"textAlign": "center"}),
+        html.Div(style={'height': '15px'}),
         #Then we add in the container for the graph
         dbc.Row(
-            dcc.Graph(id="seq_graph0", config={'displayModeBar': False}),
+            dcc.Loading(dcc.Graph(id="seq_graph0", config={'displayModeBar': False}), color='primary'),
             style={"width": "100%", "align-items": "center", 'justify-content': 'center', 'margin': 'auto'}
-        )
+        ),
+        #With clientside_toggle on, the figures of every plottype are loaded into this store once the page is shown
+        dcc.Store(id="seq_figures")
     ], fluid=True)
 
 layout = new_container
 
+#The layout is sent without any data in it; the graph (and the date bounds) are filled in by
+#the callbacks below once the page is shown. Only the datasets used here are loaded.
+figures.date_bounds("seq_dates", 'NICD_daily_smoothed')
+
 #The callbacks allow the plots to update based on what the user selects, 
 #a stacked bar chart will be created if the user selects monthly 
 #or a smoothed line graph will be created if the user selects daily
 
-@callback(
-    Output("seq_graph0", "figure"),
-    Input("plottype", "value"))
-def seq_plot(plottype):
-    colorMap = load_color_map()
-    names = {'variable':'Lineage', 'index':'Month', 'value':'Prevalence'}
-    if plottype=='monthly':
-        seq_df = load_monthly_data()
-        seq_df = seq_df[seq_df.index >=start_date]
-        seq_df = seq_df[seq_df.index <=end_date]
-        seq_df = seq_df[seq_df.sum(axis=1)>0]
-        fig2 = go.Figure(data=[go.Bar(name=sfc, x=seq_df.index, y=seq_df[sfc], marker_color=colorMap[sfc]) for j, sfc in enumerate(seq_df.columns)])
-        
-        # set bar mode to stack and configure to desired format
-        fig2.update_layout(barmode='stack',yaxis_tickformat = '.0%')
-        fig2.update_layout(legend_title_text=names['variable'])
-        fig2.update_xaxes(title_text="",hoverformat = "%b %Y")
-        fig2.update_layout(xaxis_range=[pd.to_datetime(start_date)-timedelta(days=15), pd.to_datetime(end_date)+timedelta(days=15)], template='none')
-    else:
-        seq_df_daily  = load_monthly_data_smoothed()
-        seq_df_daily = seq_df_daily[seq_df_daily.index >=start_date]
-
-        fig2 = go.Figure([go.Scatter(name=sfc,x=seq_df_daily.index, y=seq_df_daily[sfc], marker_color=colorMap[sfc],
-                                      mode='lines', stackgroup='one', fillcolor=colorMap[sfc],
-                                      line=dict(width=0.0)) for j, sfc in enumerate(seq_df_daily.columns)])
-        fig2.update_layout(legend_title_text=names['variable'],hovermode='x unified',hoverlabel=dict(font_size=12), yaxis_tickformat = '.0%')
-        fig2.update_layout(xaxis_range=[start_date, end_date], template='none')
-        fig2.update_xaxes(title_text="",hoverformat = "%b %d %Y")
-    fig2.update_layout(
-        legend=dict(
-        orientation="h",
-            yanchor="top",
-            y=-0.2,
-            xanchor="center",
-            x=0.5,
-        font={'size':15}
-    ),margin=dict(l=40, r=75, t=15, b=0))
-
-    fig2.update_yaxes(title_text="Lineage Prevalence",
-                      range=[0,1.01],
-                      automargin=True,
-                      title_standoff=20
-    )
-    return fig2
+def seq_plot(plottype, start=None, end=None, relayout=None):
+    start, end = day(start, start_date), day(end, end_date)
+    # the picked dates: a zoom within them keeps the view, other dates reset it
+    picked = f'{start}/{end}'
+    if relayout is not None and ctx.triggered_id == "seq_graph0":
+        # zooming into the daily view fetches the visible window again at full resolution
+        zoom = zoom_window(relayout) if plottype=='daily' else None
+        if zoom is None:
+            return no_update
+        if zoom[0] is not None:
+            start, end = zoom
+    # the figure is the same for every visitor until the data changes, so it is only
+    # built once per data version and served from the figure cache after that
+    dataset = 'NICD_monthly' if plottype=='monthly' else 'NICD_daily_smoothed'
+    # (colors='color_map' is the registered color map, its version is part of the cache key)
+    return figures.lineage_plot(dataset, plottype, start, end, colors='color_map', threshold=lineage_threshold,
+                                groups=lineage_groups, max_points=max_points, uirevision=picked)
+
+
+def seq_figures(start=None, end=None):
+    # the figure of every plottype, for the browser to switch between (see clientside_toggle)
+    return {plottype: seq_plot(plottype, start, end) for plottype in plottypes}
+
+
+def static_figures():
+    # what `python -m wwdash.export` puts in seq_graph0, which is otherwise filled by a callback
+    return {'seq_graph0': seq_plot('daily')}
+
+
+if clientside_toggle:
+    # the figures of every plottype are sent with the page, so switching between them is done in the
+    # browser without a round trip to the server
+    clientside_callback(
+        "function(plottype, figures) { return figures ? figures[plottype] : window.dash_clientside.no_update; }",
+        Output("seq_graph0", "figure"),
+        Input("plottype", "value"),
+        Input("seq_figures", "data"))
+    # filled when the page is shown, and again when other dates are picked
+    callback(
+        Output("seq_figures", "data"),
+        Input("seq_dates", "start_date"),
+        Input("seq_dates", "end_date"))(seq_figures)
+    # build them as soon as new data for them comes in, rather than on the next page load
+    # (only for the datasets they are made from; the others don't change them)
+    @registry.subscribe
+    def rebuild_seq_figures(name, snapshot):
+        if name in {'NICD_monthly', 'NICD_daily_smoothed', 'color_map'}:
+            seq_figures()
+else:
+    callback(
+        Output("seq_graph0", "figure"),
+        Input("plottype", "value"),
+        Input("seq_dates", "start_date"),
+        Input("seq_dates", "end_date"),
+        Input("seq_graph0", "relayoutData"))(seq_plot)
@@ -1,182 +1,174 @@
 # dash template for combined wastewate viral load and clinical count tracking
 # From Msomi and Levy et al. 2025
 
-from dash import html, dcc, Dash, Input, Output, callback # now including callbacks
+from dash import html, dcc, Dash, Input, Output, callback, clientside_callback, ctx, no_update # now including callbacks
 import dash_bootstrap_components as dbc
-import pandas as pd 
-from plotly.subplots import make_subplots
-import plotly.graph_objects as go
-from plotly.express.colors import qualitative
-from datetime import timedelta
+from plotly.colors import qualitative
+import os, sys
 
-# load case and viral load data
-def load_rsa_cases_and_levels():
-    return pd.read_feather("https://raw.githubusercontent.com/NICD-Wastewater-Genomics/NICD-Dash-Data/main/rsa_cases_vs_levels.feather")
+# the shared data layer (wwdash) lives at the top of the repository
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+from wwdash import compress, data_api, day, env_flag, figures, http_cache, instrument, registry, start_refresher, zoom_window
 
-# Now get the sequencing data outputs
-def load_monthly_data():
-    return pd.read_feather("https://raw.githubusercontent.com/NICD-Wastewater-Genomics/NICD-Dash-Data/main/NICD_monthly.feather")
-
-def load_monthly_data_smoothed():
-    return pd.read_feather("https://raw.githubusercontent.com/NICD-Wastewater-Genomics/NICD-Dash-Data/main/NICD_daily_smoothed.feather")
+# The registry loads each dataset once per machine and hands out read-only views of it,
+# so neither the layout nor the callbacks below download anything while serving.
+# load the local copies now (no download, so the app starts right away), then check GitHub for
+# updates in the background (every WWDASH_REFRESH_INTERVAL seconds); new data is swapped in without a restart
+start_refresher(['rsa_cases_vs_levels', 'NICD_monthly', 'NICD_daily_smoothed'])
 
 # choose start and end dates 
 start_date = '2024-06-01'
 end_date =  '2024-12-01'
 
+#How the wastewater levels are smoothed: 'rolling' (5 epiweek average), 'exponential' or 'loess'
+smoother = 'rolling'
+
 # alternatively, the current date can be used. 
 # end = date.today()
 
-df = load_rsa_cases_and_levels()
+# Set to True (or WWDASH_CLIENTSIDE_TOGGLE=1) to send the figures of every plottype together to the
+# page and switch between them in the browser: the toggle then costs no server time at all,
+# at the price of a larger first page load.
+clientside_toggle = env_flag('WWDASH_CLIENTSIDE_TOGGLE')
+
+# Lineages that never reach this prevalence in the plotted window are shown together as
+# "Other", which bounds the number of traces sent to the browser (0 shows every lineage).
+lineage_threshold = 0.01
+# Optionally roll lineages up to a parent first, e.g. {'XBB.1.5.1': 'XBB.1.5'}
+lineage_groups = None
+# Each daily trace is sent with at most this many points; zooming in fetches the visible
+# window again at this resolution, so the detail follows what is on screen.
+max_points = 500
+# The views offered for the lineage chart. 'monthly' and 'daily' are the published files; the
+# epiweek and quarterly views are rolled up from the daily data once per refresh (wwdash/rollup.py)
+plottypes = {
+    'epiweek': 'Weekly Trends',
+    'monthly': 'Monthly Trends',
+    'quarterly': 'Quarterly Trends',
+    'daily': 'Smoothed Daily Trends',
+}
+# lineage colors, used in order
+colorMap = qualitative.Light24
 
 # use a preset styling, here we use LUX. 
 app = Dash(external_stylesheets = [dbc.themes.LUX])
 
-def bar_chart():
-    df = load_rsa_cases_and_levels()
-    # in our data, end is the end of the epiweek
-    df['end'] = pd.to_datetime(df['end'])
-    df = df[df['end']>=start_date]
-    df = df[df['end']<=end_date]
-    
-    df_s = df[['end','sum_genomes']]
-    df_s = df_s[~df_s['sum_genomes'].isna()]
-    # calculate a simple rolling average.
-    df_s['ww_smoothed'] =df_s['sum_genomes'].rolling(window=5,min_periods=0,center=True).mean()
-    fig = make_subplots(specs=[[{"secondary_y": True}]])
-
-    fig.add_trace(
-        go.Bar(
-            x=df['end'], y=df['n'],
-            marker_color='lightgray',
-            name="Clinical",
-            hovertemplate='%{y} cases',
-            textposition = "none"),
-        secondary_y=False)
-
-    fig.add_trace(
-        go.Scatter(
-            x=df['end'], y=df['sum_genomes'],
-            mode='markers',
-            line=dict(color="cornflowerblue", width=4),
-            hovertemplate='%{y} copies/mL',
-            name="Wastewater"),
-            secondary_y=True)
-
-    fig.add_trace(
-        go.Scatter(
-            x=df_s['end'], y=df_s['ww_smoothed'],
-            mode='lines',
-            line=dict(color="cornflowerblue", width=4),
-            hovertemplate='%{y} copies/mL',
-            name="Smoothed wastewater"),
-            secondary_y=True)
-
-    fig.update_layout(
-        template='none',
-        barmode='group',
-        legend=dict(
-            orientation="h",
-            yanchor="top",
-            y=-0.2,
-            xanchor="center",
-            x=0.5
-        ),
-    margin=dict(l=45, r=0, t=20, b=50))
-    fig.update_xaxes(hoverformat = "%Y, Epiweek %W",)
-    fig.update_yaxes(title_text="Laboratory confirmed cases",
-                     secondary_y=False,
-                     range=[0,df['n'].max()*1.02],
-                     showgrid=False,
-                     automargin=True,
-                     title_standoff=20  # Add space between y-axis label and graph
-                     )
-    fig.update_yaxes(title_text="Genome Copies/ml (N Gene)",
-                     secondary_y=True,
-                     range=[0,df['sum_genomes'].max()*1.02],
-                     automargin=True,
-                     title_standoff=20  # Add space between y-axis label and graph
-                     )
-    fig.update_traces(hoverinfo = 'name+y',cliponaxis=False)
-    return fig
+# /metrics and Server-Timing headers, when WWDASH_METRICS / WWDASH_SERVER_TIMING are set
+instrument(app.server)
+# brotli/gzip for the callback responses and layout (WWDASH_COMPRESS=0 to turn off)
+compress(app.server)
+# ETags and Cache-Control, so repeat requests within a data version get a 304 (WWDASH_HTTP_CACHE=0 to turn off)
+http_cache(app.server)
+# the numbers behind the charts on /api/data, as Arrow, JSON or CSV (WWDASH_DATA_API=0 to leave out)
+data_api(app.server)
+
+# The layout is sent without any data in it: the chart is filled in by this callback once the
+# page is shown, and again when the dates change. Figures are cached per data version and date range
+@callback(
+    Output("test-graph", "figure"),
+    Input("date_range", "start_date"),
+    Input("date_range", "end_date"))
+def levels_plot(start, end):
+    start, end = day(start, start_date), day(end, end_date)
+    # built by the shared wwdash/figures.py and cached per data version and date range
+    return figures.levels_plot('rsa_cases_vs_levels', start, end, smoother)
+
+
+# the date bounds are filled in the same way
+figures.date_bounds('date_range', 'rsa_cases_vs_levels')
+
 
 #The callback allows figures to be updated based on user input - This is what makes the dashboard interactive.
-@callback(
-    Output("seq_graph0", "figure"),
-    Input("plottype", "value"))
-def seq_plot(plottype):
-    colorMap = qualitative.Light24
-    names = {'variable':'Lineage', 'index':'Month', 'value':'Prevalence'}
-    if plottype=='monthly':
-        seq_df = load_monthly_data()
-        seq_df = seq_df[seq_df.index >=start_date]
-        seq_df = seq_df[seq_df.index <=end_date]
-        seq_df = seq_df[seq_df.sum(axis=1)>0]
-        fig2 = go.Figure(data=[go.Bar(name=sfc, x=seq_df.index, y=seq_df[sfc], marker_color=colorMap[j]) for j, sfc in enumerate(seq_df.columns)])
-        
-        # set bar mode to stack and configure to desired format
-        fig2.update_layout(barmode='stack',yaxis_tickformat = '.0%')
-        fig2.update_layout(legend_title_text=names['variable'])
-        fig2.update_xaxes(title_text="",hoverformat = "%b %Y")
-        fig2.update_layout(xaxis_range=[pd.to_datetime(start_date)-timedelta(days=15), pd.to_datetime(end_date)+timedelta(days=15)], template='none')
-    else:
-        seq_df_daily  = load_monthly_data_smoothed()
-        seq_df_daily = seq_df_daily[seq_df_daily.index >=start_date]
-
-        fig2 = go.Figure([go.Scatter(name=sfc,x=seq_df_daily.index, y=seq_df_daily[sfc], marker_color=colorMap[j],
-                                      mode='lines', stackgroup='one', fillcolor=colorMap[j],
-                                      line=dict(width=0.0)) for j, sfc in enumerate(seq_df_daily.columns)])
-        fig2.update_layout(legend_title_text=names['variable'],hovermode='x unified',hoverlabel=dict(font_size=12), yaxis_tickformat = '.0%')
-        fig2.update_layout(xaxis_range=[start_date, end_date], template='none')
-        fig2.update_xaxes(title_text="",hoverformat = "%b %d %Y")
-    fig2.update_layout(
-        legend=dict(
-        orientation="h",
-            yanchor="top",
-            y=-0.2,
-            xanchor="center",
-            x=0.5,
-        font={'size':15}
-    ),margin=dict(l=40, r=75, t=15, b=0))
-
-    fig2.update_yaxes(title_text="Lineage Prevalence",
-                      range=[0,1.01],
-                      automargin=True,
-                      title_standoff=20
-    )
-    return fig2
+def seq_plot(plottype, start=None, end=None, relayout=None):
+    start, end = day(start, start_date), day(end, end_date)
+    # the picked dates: a zoom within them keeps the view, other dates reset it
+    picked = f'{start}/{end}'
+    if relayout is not None and ctx.triggered_id == "seq_graph0":
+        # zooming into the daily view fetches the visible window again at full resolution
+        zoom = zoom_window(relayout) if plottype=='daily' else None
+        if zoom is None:
+            return no_update
+        if zoom[0] is not None:
+            start, end = zoom
+    # the figure is the same for every visitor until the data changes, so it is only
+    # built once per data version and served from the figure cache after that
+    dataset = 'NICD_monthly' if plottype=='monthly' else 'NICD_daily_smoothed'
+    return figures.lineage_plot(dataset, plottype, start, end, colors=colorMap, threshold=lineage_threshold,
+                                groups=lineage_groups, max_points=max_points, uirevision=picked)
+
+
+def seq_figures(start=None, end=None):
+    # the figure of every plottype, for the browser to switch between (see clientside_toggle)
+    return {plottype: seq_plot(plottype, start, end) for plottype in plottypes}
+
+
+def static_figures():
+    # what `python -m wwdash.export` puts in the graphs, which are otherwise filled by callbacks
+    return {'test-graph': levels_plot(start_date, end_date), 'seq_graph0': seq_plot('daily')}
+
+
+if clientside_toggle:
+    # the figures of every plottype are sent with the page, so switching between them is done in the
+    # browser without a round trip to the server
+    clientside_callback(
+        "function(plottype, figures) { return figures ? figures[plottype] : window.dash_clientside.no_update; }",
+        Output("seq_graph0", "figure"),
+        Input("plottype", "value"),
+        Input("seq_figures", "data"))
+    # filled when the page is shown, and again when other dates are picked
+    callback(
+        Output("seq_figures", "data"),
+        Input("date_range", "start_date"),
+        Input("date_range", "end_date"))(seq_figures)
+    # build them as soon as new data for them comes in, rather than on the next page load
+    # (only for the datasets they are made from; the others don't change them)
+    @registry.subscribe
+    def rebuild_seq_figures(name, snapshot):
+        if name in {'NICD_monthly', 'NICD_daily_smoothed'}:
+            seq_figures()
+else:
+    callback(
+        Output("seq_graph0", "figure"),
+        Input("plottype", "value"),
+        Input("date_range", "start_date"),
+        Input("date_range", "end_date"),
+        Input("seq_graph0", "relayoutData"))(seq_plot)
+
 
 # describe what the page layout should look like
-app.layout = html.Div([
-    html.H1(id="H1", children="SARS-CoV-2 Wastewater-integrated Surveillance",
-            style={'color': 'black',"textAlign": "center"}),
-    html.Hr(),
-    html.P('A bit of information about the wastewater monitoring program.',
-           style={'color': 'black',"textAlign": "center"}),
-    dcc.Graph(figure=bar_chart(), id='test-graph', config={'displayModeBar': False}),
-    html.P('Some information on wastewater sequencing. ',
-           style={'color': 'black',"textAlign": "center"}),
-    html.Div(
-    dbc.RadioItems(
-        id="plottype",
-        className="btn-group",
-        inputClassName="btn-check",
-        labelClassName="btn btn-outline-primary",
-        labelCheckedClassName="active",
-        options=[
-            {"label": "Monthly Trends", "value": "monthly"},
-            {"label": "Smoothed Daily Trends", "value": "daily"}
-        ],
-        value="daily",
-        style={"width": "100%", "justify-content": "flex-end"}
-    ),
-    style={"marginTop": 0, "marginBottom": 0}
-    ),
-    dbc.Row(
-    dcc.Graph(id="seq_graph0", config={'displayModeBar': False}),
-    style={"width": "100%", "align-items": "center", 'justify-content': 'center', 'margin': 'auto'}
-    )
-    ])
+# (it contains no data, the graphs are filled in by the callbacks above)
+def serve_layout():
+    return html.Div([
+        html.H1(id="H1", children="SARS-CoV-2 Wastewater-integrated Surveillance",
+                style={'color': 'black',"textAlign": "center"}),
+        html.Hr(),
+        html.P('A bit of information about the wastewater monitoring program.',
+               style={'color': 'black',"textAlign": "center"}),
+        html.Div(figures.date_picker('date_range', None, start_date, end_date), style={"textAlign": "center"}),
+        dcc.Loading(dcc.Graph(id='test-graph', config={'displayModeBar': False})),
+        html.P('Some information on wastewater sequencing. ',
+               style={'color': 'black',"textAlign": "center"}),
+        html.Div(
+        dbc.RadioItems(
+            id="plottype",
+            className="btn-group",
+            inputClassName="btn-check",
+            labelClassName="btn btn-outline-primary",
+            labelCheckedClassName="active",
+            options=[{"label": label, "value": plottype} for plottype, label in plottypes.items()],
+            value="daily",
+            style={"width": "100%", "justify-content": "flex-end"}
+        ),
+        style={"marginTop": 0, "marginBottom": 0}
+        ),
+        dbc.Row(
+        dcc.Loading(dcc.Graph(id="seq_graph0", config={'displayModeBar': False})),
+        style={"width": "100%", "align-items": "center", 'justify-content': 'center', 'margin': 'auto'}
+        ),
+        dcc.Store(id="seq_figures")
+        ])
+
+app.layout = serve_layout
 
 if __name__ == "__main__":
     #run server, debug option is used to see errors in the web app. 
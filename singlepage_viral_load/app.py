@@ -1,106 +1,76 @@
 # dash template for combined wastewate viral load and clinical count tracking
 # From Msomi and Levy et al. 2025
 
-from dash import html, dcc, Dash
+from dash import html, dcc, Dash, Input, Output, callback
 import dash_bootstrap_components as dbc
-import pandas as pd 
-from plotly.subplots import make_subplots
-import plotly.graph_objects as go
+import os, sys
 
+# the shared data layer (wwdash) lives at the top of the repository
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+from wwdash import compress, data_api, day, figures, http_cache, instrument, start_refresher
 
-# load case and viral load data
-def load_rsa_cases_and_levels():
-    return pd.read_feather("https://raw.githubusercontent.com/NICD-Wastewater-Genomics/NICD-Dash-Data/main/rsa_cases_vs_levels.feather")
+# The case and viral load data is a read-only view of a locally cached copy (see wwdash/).
+# load the local copy now (no download, so the app starts right away), then check GitHub for
+# updates in the background (every WWDASH_REFRESH_INTERVAL seconds); new data is swapped in without a restart
+start_refresher(['rsa_cases_vs_levels'])
 
 # choose start and end dates 
 start_date = '2024-10-04'
 end_date =  '2025-03-01'
 
+#How the wastewater levels are smoothed: 'rolling' (5 epiweek average), 'exponential' or 'loess'
+smoother = 'rolling'
+
 # alternatively, the current date can be used. 
 # end = date.today()
 
-df = load_rsa_cases_and_levels()
-
 # use a preset styling, here we use MINTY. 
 app = Dash(external_stylesheets = [dbc.themes.MINTY])
 
-def bar_chart():
-    df = load_rsa_cases_and_levels()
-    # in our data, end is the end of the epiweek
-    df['end'] = pd.to_datetime(df['end'])
-    df = df[df['end']>=start_date]
-    df = df[df['end']<=end_date]
-    
-    df_s = df[['end','sum_genomes']]
-    df_s = df_s[~df_s['sum_genomes'].isna()]
-    # calculate a simple rolling average.
-    df_s['ww_smoothed'] =df_s['sum_genomes'].rolling(window=5,min_periods=0,center=True).mean()
-    fig = make_subplots(specs=[[{"secondary_y": True}]])
-
-    fig.add_trace(
-        go.Bar(
-            x=df['end'], y=df['n'],
-            marker_color='lightgray',
-            name="Clinical",
-            hovertemplate='%{y} cases',
-            textposition = "none"),
-        secondary_y=False)
-
-    fig.add_trace(
-        go.Scatter(
-            x=df['end'], y=df['sum_genomes'],
-            mode='markers',
-            line=dict(color="cornflowerblue", width=4),
-            hovertemplate='%{y} copies/mL',
-            name="Wastewater"),
-            secondary_y=True)
-
-    fig.add_trace(
-        go.Scatter(
-            x=df_s['end'], y=df_s['ww_smoothed'],
-            mode='lines',
-            line=dict(color="cornflowerblue", width=4),
-            hovertemplate='%{y} copies/mL',
-            name="Smoothed wastewater"),
-            secondary_y=True)
-
-    fig.update_layout(
-        template='none',
-        barmode='group',
-        legend=dict(
-            orientation="h",
-            yanchor="top",
-            y=-0.2,
-            xanchor="center",
-            x=0.5
-        ),
-    margin=dict(l=45, r=0, t=20, b=50))
-    fig.update_xaxes(hoverformat = "%Y, Epiweek %W",)
-    fig.update_yaxes(title_text="Laboratory confirmed cases",
-                     secondary_y=False,
-                     range=[0,df['n'].max()*1.02],
-                     showgrid=False,
-                     automargin=True,
-                     title_standoff=20  # Add space between y-axis label and graph
-                     )
-    fig.update_yaxes(title_text="Genome Copies/ml (N Gene)",
-                     secondary_y=True,
-                     range=[0,df['sum_genomes'].max()*1.02],
-                     automargin=True,
-                     title_standoff=20  # Add space between y-axis label and graph
-                     )
-    fig.update_traces(hoverinfo = 'name+y',cliponaxis=False)
-    return fig
+# /metrics and Server-Timing headers, when WWDASH_METRICS / WWDASH_SERVER_TIMING are set
+instrument(app.server)
+# brotli/gzip for the callback responses and layout (WWDASH_COMPRESS=0 to turn off)
+compress(app.server)
+# ETags and Cache-Control, so repeat requests within a data version get a 304 (WWDASH_HTTP_CACHE=0 to turn off)
+http_cache(app.server)
+# the numbers behind the charts on /api/data, as Arrow, JSON or CSV (WWDASH_DATA_API=0 to leave out)
+data_api(app.server)
+
+# The layout is sent without any data in it: the chart is filled in by this callback once the
+# page is shown, and again when the dates change. Figures are cached per data version and date range
+@callback(
+    Output("test-graph", "figure"),
+    Input("date_range", "start_date"),
+    Input("date_range", "end_date"))
+def levels_plot(start, end):
+    start, end = day(start, start_date), day(end, end_date)
+    # built by the shared wwdash/figures.py and cached per data version and date range
+    return figures.levels_plot('rsa_cases_vs_levels', start, end, smoother)
+
+
+# the date bounds are filled in the same way
+figures.date_bounds('date_range', 'rsa_cases_vs_levels')
+
+
+def static_figures():
+    # what `python -m wwdash.export` puts in test-graph, which is otherwise filled by the callback
+    return {'test-graph': levels_plot(start_date, end_date)}
+
 
 #describe what the page layout should look like
-app.layout = html.Div([
-    html.H1(id="H1", children="SARS-CoV-2 Wastewater-integrated Surveillance",
-            style={'color': 'black',"textAlign": "center"}),
-    html.Hr(),
-    html.P('A bit of information about the wastewater monitoring program.',
-           style={'color': 'black',"textAlign": "center"}),
-    dcc.Graph(figure=bar_chart(), id='test-graph', config={'displayModeBar': False})
-    ])
+# (it contains no data, the graphs are filled in by the callbacks above)
+def serve_layout():
+    return html.Div([
+        html.H1(id="H1", children="SARS-CoV-2 Wastewater-integrated Surveillance",
+                style={'color': 'black',"textAlign": "center"}),
+        html.Hr(),
+        html.P('A bit of information about the wastewater monitoring program.',
+               style={'color': 'black',"textAlign": "center"}),
+        html.Div(figures.date_picker('date_range', None, start_date, end_date), style={"textAlign": "center"}),
+        dcc.Loading(dcc.Graph(id='test-graph', config={'displayModeBar': False}))
+        ])
+
+app.layout = serve_layout
 
 if __name__ == "__main__":
     #run server, debug option is used to see errors in the web app. 
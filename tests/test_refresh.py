@@ -0,0 +1,53 @@
+# Run with `python -m pytest tests` from the top of the repository.
+
+import os
+import sys
+import time
+
+import flask
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'benchmarks'))
+from fixtures import serve, write_fixtures
+from wwdash.api import data_api
+from wwdash.cache import DatasetCache
+from wwdash.httpcache import http_cache
+from wwdash.refresh import Refresher
+from wwdash.registry import DatasetRegistry
+
+
+def publish(directory, seed):
+    # a new version upstream, with a later Last-Modified than the one before
+    write_fixtures(directory, lineages=8, days=120, seed=seed)
+    later = time.time() + 10 * seed
+    for top, _, files in os.walk(directory):
+        for name in files:
+            os.utime(os.path.join(top, name), (later, later))
+
+
+def test_dataset_loaded_through_the_api_is_refreshed(tmp_path):
+    upstream = str(tmp_path / 'upstream')
+    publish(upstream, 0)
+    server, url = serve(upstream)
+    try:
+        registry = DatasetRegistry(DatasetCache(str(tmp_path / 'cache'), ttl=0, base_url=url, offline=False))
+        # like start_refresher: the refresher owns revalidation of the datasets it was given
+        refresher = Refresher(['rsa_cases_vs_levels'], registry=registry)
+        refresher.refresh_once()
+        registry.background = True
+        app = flask.Flask(__name__)
+        data_api(app, registry)
+        http_cache(app, registry)
+        client = app.test_client()
+
+        first = client.get('/api/data/provincial_cases_vs_levels?format=json')
+        assert first.status_code == 200
+        publish(upstream, 1)
+        changed = refresher.refresh_once()
+
+        assert 'provincial_cases_vs_levels' in changed
+        second = client.get('/api/data/provincial_cases_vs_levels?format=json',
+                            headers={'If-None-Match': first.headers['ETag']})
+        assert second.status_code == 200
+        assert second.get_json() != first.get_json()
+    finally:
+        server.shutdown()
@@ -0,0 +1,69 @@
+# Shared data layer for the dashboard templates.
+#
+# The templates in this repository are meant to be copied and modified, so
+# everything in here is plain pandas/pyarrow code that can be read top to bottom.
+#
+# The names below are imported from their module the first time they are
+# used, and pandas is only imported by the functions that need it, so an app
+# that imports wwdash starts without paying for the modules it doesn't use
+# or for pandas (benchmarks/bench_startup.py).
+
+import importlib
+import os
+
+
+def env_flag(name, default=False):
+    """The WWDASH_* switch `name`: 1, true or yes turn it on, 0, false or no off; unset is `default`."""
+    # defined before the modules below are imported, since they read their switches with it
+    value = os.environ.get(name, '').strip().lower()
+    if value in ('1', 'true', 'yes'):
+        return True
+    if value in ('0', 'false', 'no'):
+        return False
+    return default
+
+
+# these share their name with their module, which Python sets on the package whenever the
+# module is imported, so they are bound here rather than on first use. None of them imports pandas
+from .cache import DatasetCache, SOURCES, cache, load
+from .registry import DatasetRegistry, Snapshot, registry
+from .store import STORED, DatasetStore, store
+from .metrics import instrument, metrics, stage, timed
+from .rollup import RESOLUTIONS, ROLLED, build_cube, period_window, rollup
+
+# public name -> the module that defines it
+_EXPORTS = {
+    '.refresh': ['Refresher', 'start_refresher'],
+    '.figcache': ['FigureCache', 'figure_cache'],
+    '.traces': ['figure_dict', 'stacked_traces'],
+    '.aggregate': ['collapse_lineages'],
+    '.downsample': ['downsample_frame', 'lttb_indices', 'zoom_window'],
+    '.timeindex': ['day', 'sort_by_time', 'time_indexed', 'window'],
+    '.partition': ['partition_by', 'partitioned'],
+    '.smoothing': ['SMOOTHERS', 'smoothed'],
+    '.serialize': ['dumps', 'loads', 'typed_array'],
+    '.compression': ['compress'],
+    '.httpcache': ['http_cache'],
+    '.api': ['DATASETS', 'data_api', 'select'],
+    '.lag': ['cross_correlate', 'lead_time'],
+}
+_MODULES = {name: module for module, names in _EXPORTS.items() for name in names}
+
+__all__ = ['env_flag', 'DatasetCache', 'SOURCES', 'cache', 'load', 'DatasetRegistry', 'Snapshot', 'registry',
+           'STORED', 'DatasetStore', 'store', 'instrument', 'metrics', 'stage', 'timed',
+           'RESOLUTIONS', 'ROLLED', 'build_cube', 'period_window', 'rollup'] + list(_MODULES)
+
+
+def __getattr__(name):
+    # `from wwdash import data_api` imports wwdash.api here, on first use
+    module = _MODULES.get(name)
+    if module is None:
+        # not an export: submodules (`from wwdash import figures`) are imported by Python itself
+        raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+    value = getattr(importlib.import_module(module, __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
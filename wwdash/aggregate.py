@@ -0,0 +1,65 @@
+# Collapsing lineages to bound the number of traces.
+#
+# Every lineage in the prevalence frames becomes a trace, so the browser
+# payload and render time grow with lineage diversity. collapse_lineages
+# optionally rolls lineages up to a parent first (hierarchy), then merges
+# every group that never reaches `threshold` into a single "Other" column.
+# Both steps are one matrix product over the whole frame, no per-column loop:
+#
+#   collapse_lineages(daily, threshold=0.01, hierarchy={'XBB.1.5.1': 'XBB.1.5'})
+#
+# Because prevalences are fractions of the total, the rows still sum to the
+# same value afterwards, so stacked charts look the same apart from the legend.
+
+import numpy as np
+
+from .metrics import timed
+
+
+def _sum_columns(values, labels):
+    # values (rows x columns) @ one-hot (columns x groups) = per-group sums
+    import pandas as pd
+    codes, groups = pd.factorize(labels)
+    onehot = np.zeros((len(labels), len(groups)))
+    onehot[np.arange(len(labels)), codes] = 1.0
+    return values @ onehot, groups
+
+
+@timed('aggregate')
+def collapse_lineages(frame, threshold=0.01, hierarchy=None, other='Other', max_lineages=None):
+    """Merge rare lineages of a prevalence frame (dates x lineages).
+
+    hierarchy: optional {lineage: parent} dict, or a function of the lineage
+        name returning its group, applied before the threshold. Lineages it
+        doesn't map are kept as they are.
+    threshold: groups whose peak prevalence in `frame` stays below this are
+        summed into `other` (placed last).
+    max_lineages: optionally keep at most this many groups (by peak
+        prevalence), the rest also go into `other`.
+    """
+    import pandas as pd
+    grouped = frame.to_numpy(dtype='float64', na_value=0.0)
+    groups = pd.Index(frame.columns)
+    # summed in float64, handed back in the frame's own precision (float32 after normalize.py)
+    dtype = 'float32' if len(frame.columns) and (frame.dtypes == 'float32').all() else 'float64'
+    if hierarchy is not None:
+        lookup = hierarchy if callable(hierarchy) else (lambda name: hierarchy.get(name, name))
+        grouped, groups = _sum_columns(grouped, np.array([lookup(name) for name in groups], dtype=object))
+
+    peak = grouped.max(axis=0) if len(grouped) else np.zeros(len(groups))
+    keep = peak >= threshold
+    if max_lineages is not None and keep.sum() > max_lineages:
+        ranked = np.argsort(-np.where(keep, peak, -np.inf), kind='stable')
+        keep = np.zeros(len(groups), dtype=bool)
+        keep[ranked[:max_lineages]] = True
+    if keep.all():
+        if hierarchy is None:
+            return frame
+        return pd.DataFrame(grouped.astype(dtype), index=frame.index, columns=groups)
+
+    final = np.where(keep, np.asarray(groups, dtype=object), other)
+    collapsed, final_groups = _sum_columns(grouped, final)
+    result = pd.DataFrame(collapsed.astype(dtype), index=frame.index, columns=final_groups)
+    if other in result.columns:
+        result = result[[c for c in result.columns if c != other] + [other]]
+    return result
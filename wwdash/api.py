@@ -0,0 +1,268 @@
+# Data endpoints for the numbers behind the charts.
+#
+# data_api(server) adds routes to the Flask server that hand out slices of
+# the datasets, read from the same registry as the figures, so an export never builds or renders a figure:
+#
+#   GET /api/data                     the datasets, their versions, sizes and filters
+#   GET /api/data/<name>?start=2024-01-01&end=2024-06-30
+#                       &lineages=JN.1,KP.2     lineage columns (wide datasets) or rows
+#                       &province=Gauteng       provincial datasets only
+#                       &format=arrow|json|csv  or by the Accept header; JSON by default
+#
+# Rows are selected from the snapshot's Arrow table (registry.py) without
+# going through pandas: the dates are put in time order once per data version,
+# a date range is two binary searches on them, and a province or lineages a
+# filter on the selected rows. The response is streamed in batches of
+# CHUNK_ROWS rows: an Arrow IPC stream (slices of the selected table, so the
+# numeric columns of a date range go from the memory-mapped file into the
+# record batches without being copied), a JSON array of records or CSV. Dates
+# are timestamps in Arrow and 'YYYY-MM-DD' in JSON and CSV.
+#
+#   pd.read_feather / pyarrow.ipc.open_stream(urlopen(url)).read_pandas()
+#   pd.read_csv(url + '&format=csv')
+#
+# The responses go through http_cache (httpcache.py) like the figures, so a
+# repeated export within a data version is a 304. Set WWDASH_DATA_API=0 to
+# leave the routes out.
+
+import io
+
+import numpy as np
+import pyarrow as pa
+
+from . import env_flag
+from .metrics import count, stage
+from .registry import registry as default_registry
+from .store import STORED
+from .timeindex import TIME_COLUMNS
+
+ENABLED = env_flag('WWDASH_DATA_API', default=True)
+PREFIX = '/api/data'
+CHUNK_ROWS = 10_000
+
+# dataset -> the filters it takes besides the dates: 'province' is a column, and
+# 'lineages' either the name of the lineage column or 'columns' when every column is a lineage
+DATASETS = {
+    'rsa_cases_vs_levels': {},
+    'provincial_cases_vs_levels': {'province': 'province'},
+    'NICD_monthly': {'lineages': 'columns'},
+    'NICD_daily_smoothed': {'lineages': 'columns'},
+    'merged_data_exploded': {'province': 'province', 'lineages': 'lineages'},
+}
+
+FORMATS = {
+    'arrow': 'application/vnd.apache.arrow.stream',
+    'json': 'application/json',
+    'csv': 'text/csv',
+}
+
+
+class InvalidQuery(ValueError):
+    pass
+
+
+def _time_column(name, table):
+    # the column with the dates: TIME_COLUMNS, or the index pandas saved for the wide datasets
+    column = TIME_COLUMNS.get(name)
+    if column is None:
+        column = (table.schema.pandas_metadata or {}).get('index_columns', ['__index_level_0__'])[0]
+    return column
+
+
+def _timestamps(values):
+    # dates as an Arrow timestamp column (they may be stored as strings or categoricals)
+    import pyarrow.compute as pc
+    if pa.types.is_dictionary(values.type):
+        values = pc.cast(values, values.type.value_type)
+    if not pa.types.is_timestamp(values.type):
+        values = pc.cast(values, pa.timestamp('us'))
+    return values
+
+
+def _ordered(name, registry):
+    # (table, its time column, the times in time order, the order of the rows or None if they
+    # are in time order already), once per data version
+    def build(snap):
+        table = snap.table
+        column = _time_column(name, table)
+        times = _timestamps(table.column(column))
+        values = times.to_numpy()
+        order = None
+        if len(values) and not (values[1:] >= values[:-1]).all():
+            order = np.argsort(values, kind='stable')
+            times = times.take(order)
+            values = values[order]
+        return table, column, times, order, values
+    return registry.memo(name, 'api_ordered', build)
+
+
+def select(name, start=None, end=None, lineages=None, province=None, registry=None):
+    """The rows (and columns) of dataset `name` a data request asks for, as an Arrow table sorted by date.
+
+    The date is the first column for the datasets that keep it in the
+    index, named 'date'. Raises InvalidQuery for a filter `name` doesn't take.
+    """
+    import pyarrow.compute as pc
+    registry = registry or default_registry
+    filters = DATASETS[name]
+    if province is not None and 'province' not in filters:
+        raise InvalidQuery(f'{name} has no provinces')
+    if lineages is not None and 'lineages' not in filters:
+        raise InvalidQuery(f'{name} has no lineages')
+    table, column, times, order, sorted_times = _ordered(name, registry)
+    lo = np.searchsorted(sorted_times, np.datetime64(start, 'ns'), 'left') if start is not None else 0
+    hi = np.searchsorted(sorted_times, np.datetime64(end, 'ns'), 'right') if end is not None else len(sorted_times)
+    # a date range of time-ordered rows is a slice, which doesn't copy anything
+    rows = table.slice(lo, hi - lo) if order is None else table.take(order[lo:hi])
+    times = times.slice(lo, hi - lo)
+    if TIME_COLUMNS.get(name) is not None:
+        rows = rows.set_column(rows.schema.get_field_index(column), column, times)
+    else:
+        rows = rows.drop_columns([column])
+        if lineages is not None:
+            wanted = set(lineages)
+            rows = rows.select([c for c in rows.column_names if c in wanted])
+        rows = rows.add_column(0, 'date', times)
+    mask = None
+    if province is not None:
+        mask = pc.is_in(rows.column(filters['province']), value_set=pa.array([province]))
+    if lineages is not None and filters['lineages'] != 'columns':
+        wanted = pc.is_in(rows.column(filters['lineages']), value_set=pa.array(lineages))
+        mask = wanted if mask is None else pc.and_(mask, wanted)
+    if mask is not None:
+        rows = rows.filter(mask)
+    return rows.replace_schema_metadata(None)
+
+
+def _csv_columns(table):
+    # timestamp columns as 'YYYY-MM-DD' strings (with the time if there is one) and NaN as an
+    # empty field, like pandas writes them
+    import pyarrow.compute as pc
+    for i, field in enumerate(table.schema):
+        values = table.column(i)
+        if pa.types.is_timestamp(field.type):
+            days = pc.all(pc.equal(pc.floor_temporal(values, unit='day'), values)).as_py() is not False
+            table = table.set_column(i, field.name, pc.strftime(values, '%Y-%m-%d' if days else '%Y-%m-%dT%H:%M:%S'))
+        elif pa.types.is_floating(field.type):
+            table = table.set_column(i, field.name, pc.if_else(pc.is_nan(values), pa.scalar(None, field.type), values))
+    return table
+
+
+def _dates(frame):
+    # datetime columns as 'YYYY-MM-DD' strings (with the time if there is one), for JSON
+    import pandas as pd
+    frame = frame.copy(deep=False)
+    for column in frame.columns:
+        if pd.api.types.is_datetime64_any_dtype(frame[column]):
+            values = frame[column].to_numpy()
+            days = values.astype('datetime64[D]')
+            frame[column] = np.datetime_as_string(values, unit='D' if (days == values).all() else 's')
+    return frame
+
+
+def _chunks(table):
+    # slices of the table (views, not copies), and one empty slice for an empty table
+    for offset in range(0, max(table.num_rows, 1), CHUNK_ROWS):
+        yield table.slice(offset, CHUNK_ROWS)
+
+
+def stream_arrow(table):
+    sink = io.BytesIO()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        for chunk in _chunks(table):
+            with stage('encode'):
+                writer.write_table(chunk)
+            yield sink.getvalue()
+            sink.seek(0)
+            sink.truncate()
+    # the end-of-stream marker written when the writer closed
+    yield sink.getvalue()
+
+
+def stream_json(table):
+    yield '['
+    for i, chunk in enumerate(_chunks(table)):
+        with stage('encode'):
+            records = _dates(chunk.to_pandas()).to_json(orient='records')[1:-1]
+        if records:
+            yield (',' if i else '') + records
+    yield ']'
+
+
+def stream_csv(table):
+    # pyarrow's CSV writer, many times faster than DataFrame.to_csv
+    import pyarrow.csv as csv
+    sink = io.BytesIO()
+    for i, chunk in enumerate(_chunks(table)):
+        with stage('encode'):
+            csv.write_csv(_csv_columns(chunk), sink, csv.WriteOptions(include_header=i == 0))
+        yield sink.getvalue()
+        sink.seek(0)
+        sink.truncate()
+
+
+STREAMS = {'arrow': stream_arrow, 'json': stream_json, 'csv': stream_csv}
+
+
+def _format(request):
+    name = request.args.get('format')
+    if name is not None:
+        if name not in FORMATS:
+            raise InvalidQuery(f'unknown format {name!r}, expected one of {", ".join(FORMATS)}')
+        return name
+    best = request.accept_mimetypes.best_match(list(FORMATS.values()), default=FORMATS['json'])
+    return next(name for name, mimetype in FORMATS.items() if mimetype == best)
+
+
+def _day(request, arg):
+    value = request.args.get(arg)
+    if value is None:
+        return None
+    import pandas as pd
+    try:
+        return pd.Timestamp(value)
+    except ValueError:
+        raise InvalidQuery(f'{arg} is not a date: {value!r}') from None
+
+
+def _list(request, arg):
+    # ?lineages=JN.1,KP.2 or ?lineages=JN.1&lineages=KP.2
+    values = [v for value in request.args.getlist(arg) for v in value.split(',') if v]
+    return values or None
+
+
+def data_api(server, registry=None, prefix=PREFIX):
+    """Add the /api/data routes to the Flask `server` (unless WWDASH_DATA_API=0)."""
+    if not ENABLED:
+        return server
+    from flask import Response, jsonify, request
+    registry = registry or default_registry
+
+    def index():
+        datasets = {}
+        for name, filters in DATASETS.items():
+            # the Arrow table only, nothing is converted to pandas for this
+            snap = registry.snapshot(name)
+            datasets[name] = {'version': snap.version, 'rows': snap.table.num_rows,
+                              'filters': ['start', 'end'] + sorted(filters),
+                              'partitioned': name in STORED, 'url': f'{prefix}/{name}'}
+        return jsonify(datasets=datasets, formats=list(FORMATS))
+
+    def dataset(name):
+        if name not in DATASETS:
+            return jsonify(error=f'unknown dataset {name!r}'), 404
+        try:
+            fmt = _format(request)
+            table = select(name, _day(request, 'start'), _day(request, 'end'), _list(request, 'lineages'),
+                           request.args.get('province'), registry)
+        except InvalidQuery as err:
+            return jsonify(error=str(err)), 400
+        count('wwdash_data_api_total', dataset=name, format=fmt)
+        response = Response(STREAMS[fmt](table), mimetype=FORMATS[fmt])
+        if fmt == 'csv':
+            response.headers['Content-Disposition'] = f'attachment; filename="{name}.csv"'
+        return response
+
+    server.add_url_rule(prefix, 'wwdash_data_index', index)
+    server.add_url_rule(f'{prefix}/<name>', 'wwdash_data', dataset)
+    return server
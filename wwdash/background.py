@@ -0,0 +1,40 @@
+# A manager for Dash background callbacks, when one is installed.
+#
+# A background callback runs in a separate process and the browser polls for
+# its result, so a slow computation (the lead time bootstrap, lag.py) neither
+# holds a web worker nor runs into a proxy timeout. Dash needs a manager for
+# that; with diskcache installed (pip install "dash[diskcache]") manager()
+# returns one that keeps jobs and results in <cache dir>/background, shared
+# by the workers on the host. Results are keyed by the callback's inputs and
+# the versions of `datasets`, so a finished result is reused until the data
+# changes:
+#
+#   manager = background.manager('rsa_cases_vs_levels')
+#   @callback(..., background=manager is not None, manager=manager)
+#
+# Without diskcache, manager() returns None and the callback runs as an
+# ordinary one.
+
+import logging
+import os
+
+from .registry import registry as default_registry
+
+log = logging.getLogger(__name__)
+
+# seconds a finished result is kept
+EXPIRE = 24 * 3600
+
+
+def manager(*datasets, registry=None):
+    """A DiskcacheManager keyed by the versions of `datasets`, or None without diskcache."""
+    registry = registry or default_registry
+    try:
+        import diskcache
+        from dash import DiskcacheManager
+        cache = diskcache.Cache(os.path.join(registry.cache.cache_dir, 'background'))
+        return DiskcacheManager(cache, cache_by=[lambda: [registry.version(name) for name in datasets]],
+                                expire=EXPIRE)
+    except ImportError:  # optional (it also needs multiprocess and psutil)
+        log.info('diskcache is not installed, background callbacks run in the web worker')
+        return None
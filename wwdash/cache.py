@@ -0,0 +1,320 @@
+# Local on-disk cache for the dashboard datasets.
+#
+# Every dataset is kept as an uncompressed Arrow IPC (feather v2) file, so it
+# can be memory-mapped rather than read into memory, with compact dtypes
+# (normalize.py). A local copy younger than CACHE_TTL seconds is used as-is.
+# An older one is revalidated upstream with If-None-Match / If-Modified-Since
+# and only downloaded again if it changed.
+# When upstream can't be reached the last local copy is served, so a
+# pre-seeded cache directory is all a worker needs to run offline.
+#
+# Settings (environment variables):
+#   WWDASH_CACHE_DIR     where local copies live (default: ~/.cache/wwdash)
+#   WWDASH_CACHE_TTL     seconds before a local copy is revalidated (default: 3600)
+#   WWDASH_OFFLINE       set to 1 to never touch the network
+#   WWDASH_DATA_URL      replaces https://raw.githubusercontent.com, e.g. with a
+#                        local `python -m http.server` mirroring the same paths
+#   WWDASH_HTTP_TIMEOUT  seconds to wait on upstream (default: 30)
+#   WWDASH_FETCH_WORKERS downloads run at the same time by fetch_all (default:
+#                        one per dataset)
+#
+# fetch_all() checks several datasets at once on a thread pool that shares
+# one pooled HTTP session, so fetching everything takes about as long as the
+# slowest file instead of the sum of all of them:
+#
+#   python -m wwdash.cache     # downloads everything and prints a report
+
+import contextlib
+import hashlib
+import io
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import fcntl
+except ImportError:  # Windows, where `python app.py` only runs one process anyway
+    fcntl = None
+
+import pyarrow as pa
+import pyarrow.feather as feather
+
+from . import env_flag
+from .metrics import count, stage
+from .normalize import FORMAT, normalize
+
+# requests and pyarrow.compute are only imported once something is downloaded,
+# they aren't needed to serve from the local copies (see start_refresher)
+
+log = logging.getLogger(__name__)
+
+GITHUB = 'https://raw.githubusercontent.com'
+
+# dataset name -> path on GitHub. Add your own files here.
+SOURCES = {
+    'rsa_cases_vs_levels': '/NICD-Wastewater-Genomics/NICD-Dash-Data/main/rsa_cases_vs_levels.feather',
+    'NICD_monthly': '/NICD-Wastewater-Genomics/NICD-Dash-Data/main/NICD_monthly.feather',
+    'NICD_daily_smoothed': '/NICD-Wastewater-Genomics/NICD-Dash-Data/main/NICD_daily_smoothed.feather',
+    'provincial_cases_vs_levels': '/NICD-Wastewater-Genomics/NICD-Dash-Data/main/provincial_cases_vs_levels.feather',
+    'merged_data_exploded': '/NICD-Wastewater-Genomics/NICD-Dash-Data/main/merged_data_exploded.feather',
+    'color_map': '/NICD-Wastewater-Genomics/NICD-Freyja-outputs-/main/scripts/color_map.json',
+}
+
+
+class DatasetCache:
+
+    def __init__(self, cache_dir=None, ttl=None, base_url=None, offline=None, timeout=None):
+        self.cache_dir = cache_dir or os.environ.get(
+            'WWDASH_CACHE_DIR', os.path.join(os.path.expanduser('~'), '.cache', 'wwdash'))
+        self.ttl = float(ttl if ttl is not None else os.environ.get('WWDASH_CACHE_TTL', 3600))
+        self.base_url = (base_url or os.environ.get('WWDASH_DATA_URL', GITHUB)).rstrip('/')
+        self.offline = offline if offline is not None else env_flag('WWDASH_OFFLINE')
+        self.timeout = float(timeout if timeout is not None else os.environ.get('WWDASH_HTTP_TIMEOUT', 30))
+        self.workers = int(os.environ.get('WWDASH_FETCH_WORKERS', len(SOURCES)))
+        self._session = None
+        self._session_lock = threading.Lock()
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    @property
+    def session(self):
+        # one session for all downloads, with enough pooled connections for fetch_all's threads
+        with self._session_lock:
+            if self._session is None:
+                import requests
+                from requests.adapters import HTTPAdapter
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=self.workers, pool_maxsize=self.workers)
+                session.mount('http://', adapter)
+                session.mount('https://', adapter)
+                self._session = session
+        return self._session
+
+    def url(self, name):
+        return self.base_url + SOURCES[name]
+
+    def path(self, name):
+        return os.path.join(self.cache_dir, name + '.arrow')
+
+    def meta(self, name):
+        try:
+            with open(os.path.join(self.cache_dir, name + '.meta.json')) as fh:
+                return json.load(fh)
+        except (OSError, ValueError):
+            return {}
+
+    def _write_meta(self, name, meta):
+        path = os.path.join(self.cache_dir, name + '.meta.json')
+        with open(path + '.tmp', 'w') as fh:
+            json.dump(meta, fh)
+        os.replace(path + '.tmp', path)
+
+    @contextlib.contextmanager
+    def _host_lock(self, name):
+        # one download per host: other workers wait here and then find a fresh copy
+        if fcntl is None:
+            yield
+            return
+        with open(os.path.join(self.cache_dir, name + '.lock'), 'w') as fh:
+            fcntl.flock(fh, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(fh, fcntl.LOCK_UN)
+
+    def has_local(self, name):
+        if os.path.exists(self.path(name)):
+            if self.meta(name).get('format') != FORMAT:
+                self._renormalize(name)
+            return True
+        return self._import_seed(name)
+
+    def _renormalize(self, name):
+        # a copy written before the current normalize() (see normalize.py), redone in place
+        with self._host_lock(name):
+            meta = self.meta(name)
+            if meta.get('format') == FORMAT:
+                return
+            table, report = normalize(name, self.read_table(name, local=True))
+            _write_arrow(table, self.path(name))
+            meta.update(format=FORMAT, memory=[report['memory_before'], report['memory_after']])
+            self._write_meta(name, meta)
+
+    def _usable(self, name, force):
+        meta = self.meta(name)
+        have_local = self.has_local(name)
+        fresh = time.time() - meta.get('checked_at', 0) < self.ttl
+        return have_local, have_local and (self.offline or (fresh and not force))
+
+    def fetch(self, name, force=False):
+        """Make sure a usable local copy of `name` exists and return its path."""
+        path = self.path(name)
+        have_local, usable = self._usable(name, force)
+        if usable:
+            return path
+        if self.offline:
+            raise FileNotFoundError(
+                f'{name} is not in the cache at {self.cache_dir} and WWDASH_OFFLINE is set')
+        started = time.time()
+        with self._host_lock(name):
+            # somebody else may have refreshed it while we were waiting (checked_at is only
+            # written once the new copy is complete)
+            if self.meta(name).get('checked_at', 0) >= started:
+                return path
+            # or written a copy since we looked, which can then be revalidated rather than downloaded
+            return self._revalidate(name, have_local or os.path.exists(path))
+
+    def fetch_all(self, names=None, force=False, workers=None):
+        """fetch() several datasets concurrently and report how each went.
+
+        Returns one dict per dataset, in the order given, with its name,
+        status ('downloaded', 'not modified', 'cached' or 'failed'), seconds
+        taken, size in bytes, memory before and after normalization and the
+        error if it failed. A failure doesn't stop the others.
+        """
+        names = list(SOURCES if names is None else names)
+        if not names:
+            return []
+        with ThreadPoolExecutor(max_workers=min(workers or self.workers, len(names)),
+                                thread_name_prefix='wwdash-fetch') as pool:
+            return list(pool.map(lambda name: self._timed_fetch(name, force), names))
+
+    def _timed_fetch(self, name, force):
+        before = self.meta(name)
+        started = time.perf_counter()
+        entry = {'name': name, 'status': 'failed', 'seconds': 0.0, 'bytes': None, 'memory': None, 'error': None}
+        try:
+            self.fetch(name, force)
+        except Exception as err:
+            entry['error'] = err
+        entry['seconds'] = time.perf_counter() - started
+        if entry['error'] is None:
+            after = self.meta(name)
+            if after.get('fetched_at') != before.get('fetched_at'):
+                entry['status'] = 'downloaded'
+            elif after.get('checked_at') != before.get('checked_at'):
+                entry['status'] = 'not modified'
+            else:
+                entry['status'] = 'cached'
+            entry['bytes'] = after.get('size')
+            entry['memory'] = after.get('memory')
+        count('wwdash_fetch_total', dataset=name, status=entry['status'])
+        return entry
+
+    def _revalidate(self, name, have_local):
+        import requests
+        path = self.path(name)
+        meta = self.meta(name)
+        headers = {}
+        if have_local and meta.get('etag'):
+            headers['If-None-Match'] = meta['etag']
+        if have_local and meta.get('last_modified'):
+            headers['If-Modified-Since'] = meta['last_modified']
+        try:
+            with stage('download'):
+                resp = self.session.get(self.url(name), headers=headers, timeout=self.timeout)
+            resp.raise_for_status()
+        except requests.RequestException as err:
+            if not have_local:
+                raise
+            # upstream is slow or down, keep serving what we have
+            log.warning('could not revalidate %s (%s), using local copy', name, err)
+            return path
+
+        if resp.status_code != 304:
+            table, report = normalize(name, _decode(name, resp.content))
+            _write_arrow(table, path)
+            meta.update(format=FORMAT, memory=[report['memory_before'], report['memory_after']])
+            meta.update(url=self.url(name),
+                        version=hashlib.sha1(resp.content).hexdigest()[:12],
+                        etag=resp.headers.get('ETag'),
+                        last_modified=resp.headers.get('Last-Modified'),
+                        fetched_at=time.time(),
+                        size=len(resp.content))
+            log.info('downloaded %s (%d bytes)', name, len(resp.content))
+        # only now, so that fetch() in another process doesn't take a half-written copy for a fresh one
+        meta['checked_at'] = time.time()
+        self._write_meta(name, meta)
+        return path
+
+    def _import_seed(self, name):
+        # a cache directory can also be seeded with the raw upstream files,
+        # e.g. NICD_monthly.feather copied next to where NICD_monthly.arrow goes
+        raw = os.path.join(self.cache_dir, os.path.basename(SOURCES[name]))
+        if not os.path.exists(raw):
+            return False
+        with open(raw, 'rb') as fh:
+            content = fh.read()
+        table, report = normalize(name, _decode(name, content))
+        _write_arrow(table, self.path(name))
+        self._write_meta(name, {'version': hashlib.sha1(content).hexdigest()[:12],
+                                'fetched_at': os.path.getmtime(raw), 'checked_at': 0, 'format': FORMAT,
+                                'memory': [report['memory_before'], report['memory_after']]})
+        return True
+
+    def read_table(self, name, local=False):
+        # memory-mapped: pages come from the OS page cache, not a private copy.
+        # local=True maps whatever copy is there without checking upstream
+        path = self.path(name) if local else self.fetch(name)
+        return pa.ipc.open_file(pa.memory_map(path, 'r')).read_all()
+
+    def load(self, name):
+        df = self.read_table(name).to_pandas()
+        if SOURCES[name].endswith('.json'):
+            return df['value'].rename(None)
+        return df
+
+
+def _decode(name, content):
+    if SOURCES[name].endswith('.json'):
+        # the color map is a flat {lineage: color} object
+        import pandas as pd
+        series = pd.read_json(io.BytesIO(content), typ='series')
+        return pa.Table.from_pandas(series.to_frame('value'))
+    return feather.read_table(pa.BufferReader(content))
+
+
+def _write_arrow(table, path):
+    # uncompressed and in one chunk per column so it can be mapped straight in.
+    # Float nulls are stored as NaN, which lets pandas wrap the mapped buffers
+    # without copying them (see registry.py).
+    import pyarrow.compute as pc
+    table = table.combine_chunks()
+    for i, field in enumerate(table.schema):
+        if pa.types.is_floating(field.type) and table.column(i).null_count:
+            filled = pc.fill_null(table.column(i), float('nan'))
+            table = table.set_column(i, field, filled)
+    with pa.OSFile(path + '.tmp', 'wb') as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    os.replace(path + '.tmp', path)
+
+
+cache = DatasetCache()
+
+
+def load(name):
+    return cache.load(name)
+
+
+def format_report(report):
+    lines = [f'{"dataset":<28} {"status":<13} {"seconds":>8} {"bytes":>12} {"memory MB":>16}']
+    for entry in report:
+        size = '' if entry['bytes'] is None else f'{entry["bytes"]:,}'
+        # in memory, before -> after normalization (see normalize.py)
+        memory = '' if not entry.get('memory') else '{:.2f} -> {:.2f}'.format(*(m / 1e6 for m in entry['memory']))
+        lines.append(f'{entry["name"]:<28} {entry["status"]:<13} {entry["seconds"]:>8.2f} {size:>12} {memory:>16}')
+        if entry['error'] is not None:
+            lines.append(f'    {entry["error"]}')
+    return '\n'.join(lines)
+
+
+if __name__ == '__main__':
+    # python -m wwdash.cache  downloads everything, e.g. to seed an offline cache dir
+    logging.basicConfig(level=logging.INFO)
+    started = time.perf_counter()
+    report = cache.fetch_all(force=True)
+    print(format_report(report))
+    print(f'{len(report)} datasets in {time.perf_counter() - started:.2f} s, into {cache.cache_dir}')
@@ -0,0 +1,96 @@
+# Compressed responses for the Dash JSON endpoints.
+#
+# Figure JSON compresses very well (every trace of a stacked chart repeats
+# the same dates), so the callback responses (/_dash-update-component), the
+# layout (/_dash-layout), the callback list and the page itself are sent
+# with brotli if the browser accepts it and the brotli package is
+# installed, with gzip otherwise:
+#
+#   from wwdash import compress
+#   compress(app.server)
+#
+# Between refreshes, most callback responses are the same bytes over and over
+# (figure cache hits), so the last WWDASH_COMPRESS_CACHE (default: 32)
+# compressed bodies are kept and reused rather than compressed again.
+# Set WWDASH_COMPRESS=0 to turn compression off, e.g. behind a proxy that
+# compresses already.
+
+import gzip
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+try:
+    import brotli
+except ImportError:  # optional, gzip is used instead
+    brotli = None
+
+from . import env_flag
+from .metrics import stage
+
+ENABLED = env_flag('WWDASH_COMPRESS', default=True)
+# responses smaller than this are sent as they are
+MIN_SIZE = 1024
+# fast settings: a callback response is compressed while the user waits for it
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+MIMETYPES = ('application/json', 'text/html')
+
+
+class _Compressed:
+
+    def __init__(self, maxsize=None):
+        self.maxsize = int(maxsize if maxsize is not None else os.environ.get('WWDASH_COMPRESS_CACHE', 32))
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, encoding, data):
+        # keyed by a digest of the body, so the cache doesn't keep the uncompressed bodies too
+        key = (encoding, hashlib.blake2b(data, digest_size=16).digest())
+        with self._lock:
+            body = self._entries.get(key)
+            if body is not None:
+                self._entries.move_to_end(key)
+                return body
+        with stage('compress'):
+            body = brotli.compress(data, quality=BROTLI_QUALITY) if encoding == 'br' \
+                else gzip.compress(data, GZIP_LEVEL)
+        with self._lock:
+            self._entries[key] = body
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+        return body
+
+
+def _encoding(accept):
+    if brotli is not None and accept['br']:
+        return 'br'
+    if accept['gzip']:
+        return 'gzip'
+    return None
+
+
+def compress(server, maxsize=None):
+    """Compress the JSON and HTML responses of the Flask `server` (unless WWDASH_COMPRESS=0)."""
+    if not ENABLED:
+        return server
+    from flask import request
+    compressed = _Compressed(maxsize)
+
+    def after(response):
+        # streamed responses (the data API) are sent as they are produced, not collected to compress
+        if response.status_code != 200 or response.direct_passthrough or response.is_streamed \
+                or 'Content-Encoding' in response.headers or response.mimetype not in MIMETYPES:
+            return response
+        response.vary.add('Accept-Encoding')
+        encoding = _encoding(request.accept_encodings)
+        data = response.get_data()
+        if encoding is None or len(data) < MIN_SIZE:
+            return response
+        response.set_data(compressed.get(encoding, data))
+        response.headers['Content-Encoding'] = encoding
+        return response
+
+    server.after_request(after)
+    return server
@@ -0,0 +1,79 @@
+# Server-side downsampling of long time series.
+#
+# A multi-year daily window has thousands of points per lineage, far more
+# than a chart a few hundred pixels wide can show. downsample_frame keeps at
+# most `max_points` rows, chosen with Largest-Triangle-Three-Buckets (LTTB),
+# which keeps the peaks and troughs that a plain stride would miss.
+#
+# The prevalence charts are stacked, so every trace has to keep the same x
+# values. Rows are therefore picked once for the whole frame: in each bucket
+# the row with the largest triangle area summed over all lineages wins.
+#
+# zoom_window() reads a dcc.Graph's relayoutData, so a callback can fetch the
+# zoomed-in window again with the full point budget and the detail sent to
+# the browser follows what is visible.
+
+import numpy as np
+
+from .metrics import timed
+
+
+def lttb_indices(x, y, n_out):
+    """Positions of the rows LTTB keeps, for y of shape (n,) or (n, columns)."""
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+    x = np.asarray(x)
+    if np.issubdtype(x.dtype, np.datetime64):
+        x = x.astype('int64')
+    x = x.astype('float64')
+    y = np.asarray(y, dtype='float64').reshape(n, -1)
+
+    # first and last point are always kept, the rest is split into n_out - 2 buckets
+    edges = np.linspace(1, n - 1, n_out - 1).astype(int)
+    keep = np.empty(n_out, dtype=int)
+    keep[0], keep[-1] = 0, n - 1
+    a = 0
+    for i in range(n_out - 2):
+        lo, hi = edges[i], edges[i + 1]
+        next_lo, next_hi = (hi, edges[i + 2]) if i + 2 < len(edges) else (n - 1, n)
+        avg_x = x[next_lo:next_hi].mean()
+        avg_y = y[next_lo:next_hi].mean(axis=0)
+        # twice the triangle area (a, candidate, next bucket average), summed over columns
+        area = np.abs((x[a] - avg_x) * (y[lo:hi] - y[a])
+                      - (x[a] - x[lo:hi, None]) * (avg_y - y[a])).sum(axis=1)
+        a = lo + int(area.argmax())
+        keep[i + 1] = a
+    return keep
+
+
+@timed('downsample')
+def downsample_frame(frame, max_points):
+    """At most `max_points` rows of a time-indexed frame, shared by all columns."""
+    if max_points is None or len(frame) <= max_points:
+        return frame
+    values = frame.to_numpy(dtype='float64', na_value=0.0)
+    return frame.iloc[lttb_indices(frame.index.values, values, max_points)]
+
+
+def zoom_window(relayout):
+    """The x range a relayoutData event asks for.
+
+    Returns None if the event doesn't touch the x axis (e.g. the initial
+    autosize), (None, None) when the axis was reset, and (start, end) as
+    'YYYY-MM-DD' strings after zooming or panning.
+    """
+    if not relayout:
+        return None
+    if relayout.get('xaxis.autorange'):
+        return (None, None)
+    if 'xaxis.range[0]' in relayout and 'xaxis.range[1]' in relayout:
+        start, end = relayout['xaxis.range[0]'], relayout['xaxis.range[1]']
+    elif 'xaxis.range' in relayout:
+        start, end = relayout['xaxis.range']
+    else:
+        return None
+    # whole days (rounded outwards), so nearby zooms share cached figures
+    import pandas as pd
+    return (pd.Timestamp(start).floor('D').strftime('%Y-%m-%d'),
+            pd.Timestamp(end).ceil('D').strftime('%Y-%m-%d'))
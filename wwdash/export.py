@@ -0,0 +1,194 @@
+# Static export of a dashboard.
+#
+#   python -m wwdash.export multipage site/
+#
+# imports the app in the given template directory, renders every page's
+# layout with the data currently in the cache and writes it out as plain
+# HTML, one index.html per page path, so the pages can be served by
+# nginx or a CDN. Every figure is also written next to its page as
+# <graph id>.json. plotly.js is copied to assets/ so the export has no
+# outside dependencies other than the app's external stylesheets.
+#
+# Figures that are filled in by a callback (e.g. seq_graph0) are only
+# exported if the page module provides static_figures(), returning
+# {graph id: figure} for the default state of the page. Inputs like radio
+# buttons are left out of the export: the interactive views stay with the
+# Dash app. Rerun the export whenever the data is refreshed.
+
+import argparse
+import html as html_escape
+import importlib
+import json
+import os
+import re
+import sys
+
+import dash
+import dash_bootstrap_components as dbc
+from dash import dcc
+from plotly.offline import get_plotlyjs
+
+from .serialize import dumps
+
+# interactive inputs have no static equivalent and are skipped
+SKIPPED = (dcc.Store, dcc.Location, dcc.RadioItems, dcc.Dropdown, dcc.DatePickerRange,
+           dcc.DatePickerSingle, dcc.Slider, dcc.RangeSlider, dcc.Interval,
+           dbc.RadioItems, dbc.Checklist, dbc.Select, dbc.Input)
+
+# bootstrap classes for the dash-bootstrap-components used in the templates
+DBC_CLASSES = {
+    'Container': 'container', 'Row': 'row', 'Col': 'col', 'Navbar': 'navbar navbar-expand',
+    'DropdownMenu': 'dropdown', 'DropdownMenuItem': 'dropdown-item',
+}
+
+# css properties react leaves unitless, everything else numeric gets px
+UNITLESS = {'opacity', 'z-index', 'font-weight', 'line-height', 'flex', 'flex-grow',
+            'flex-shrink', 'order', 'zoom'}
+
+PAGE = """<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<meta name="viewport" content="width=device-width, initial-scale=1">
+<title>{title}</title>
+{stylesheets}
+<script src="{root}assets/plotly.min.js"></script>
+</head>
+<body>
+{body}
+</body>
+</html>
+"""
+
+
+def _style(style):
+    parts = []
+    for key, value in style.items():
+        key = re.sub(r'([A-Z])', lambda m: '-' + m.group(1).lower(), key)
+        if isinstance(value, (int, float)) and key not in UNITLESS:
+            value = f'{value}px'
+        parts.append(f'{key}: {value}')
+    return '; '.join(parts)
+
+
+class Renderer:
+
+    def __init__(self, page_layout=None, figures=None):
+        self.page_layout = page_layout
+        self.figures = figures or {}
+        self.exported = {}
+
+    def render(self, component):
+        if component is None or isinstance(component, bool):
+            return ''
+        if isinstance(component, (str, int, float)):
+            return html_escape.escape(str(component))
+        if isinstance(component, (list, tuple)):
+            return '\n'.join(self.render(c) for c in component)
+        if isinstance(component, SKIPPED):
+            return ''
+        if getattr(component, 'id', None) == '_pages_content' and self.page_layout is not None:
+            # dash.page_container: put the page being exported in its place
+            return self.render(self.page_layout)
+        if isinstance(component, dcc.Graph):
+            return self._graph(component)
+        if isinstance(component, dcc.Loading):
+            return self.render(component.children)
+        return self._element(component)
+
+    def _element(self, component):
+        name = type(component).__name__
+        classes = [getattr(component, 'className', None)]
+        if type(component).__module__.startswith('dash.html'):
+            tag = name.lower()
+        else:
+            tag = 'nav' if name == 'Navbar' else 'a' if getattr(component, 'href', None) else 'div'
+            classes.insert(0, DBC_CLASSES.get(name))
+            if name == 'Container' and getattr(component, 'fluid', False):
+                classes[0] = 'container-fluid'
+        attrs = []
+        if getattr(component, 'id', None):
+            attrs.append(f'id="{html_escape.escape(str(component.id))}"')
+        classes = ' '.join(c for c in classes if c)
+        if classes:
+            attrs.append(f'class="{html_escape.escape(classes)}"')
+        if getattr(component, 'style', None):
+            attrs.append(f'style="{html_escape.escape(_style(component.style))}"')
+        if getattr(component, 'href', None):
+            attrs.append(f'href="{html_escape.escape(component.href)}"')
+        children = getattr(component, 'children', None)
+        if children is None and name == 'DropdownMenu':
+            children = component.label
+        open_tag = ' '.join([tag] + attrs)
+        if tag in ('hr', 'br', 'img'):
+            return f'<{open_tag}>'
+        return f'<{open_tag}>{self.render(children)}</{tag}>'
+
+    def _graph(self, graph):
+        figure = getattr(graph, 'figure', None) or self.figures.get(graph.id)
+        if figure is None:
+            return ''
+        text = dumps(figure)
+        self.exported[graph.id] = text
+        config = json.dumps(graph.config or {})
+        # '</' would end the inline script early
+        inline = text.replace('</', '<\\/')
+        return (f'<div id="{graph.id}"></div>\n'
+                f'<script>var fig = {inline};\n'
+                f'Plotly.newPlot("{graph.id}", fig.data, fig.layout, {config});</script>')
+
+
+def _pages(app, module):
+    if getattr(app, 'use_pages', False) or dash.page_registry:
+        for page in dash.page_registry.values():
+            page_module = sys.modules.get(page['module'])
+            yield page['path'], page['name'], page['layout'], page_module
+    else:
+        yield '/', app.title, None, module
+
+
+def export(template_dir, out_dir):
+    template_dir = os.path.abspath(template_dir)
+    out_dir = os.path.abspath(out_dir)
+    sys.path.insert(0, template_dir)
+    os.chdir(template_dir)
+    module = importlib.import_module('app')
+    app = module.app
+
+    os.makedirs(os.path.join(out_dir, 'assets'), exist_ok=True)
+    with open(os.path.join(out_dir, 'assets', 'plotly.min.js'), 'w') as fh:
+        fh.write(get_plotlyjs())
+    stylesheets = '\n'.join(f'<link rel="stylesheet" href="{s}">'
+                            for s in app.config.external_stylesheets if isinstance(s, str))
+
+    written = []
+    for path, title, page_layout, page_module in _pages(app, module):
+        if callable(page_layout):
+            page_layout = page_layout()
+        figures = {}
+        if hasattr(page_module, 'static_figures'):
+            figures = page_module.static_figures()
+        renderer = Renderer(page_layout, figures)
+        layout = app.layout() if callable(app.layout) else app.layout
+        body = renderer.render(layout)
+
+        page_dir = os.path.join(out_dir, path.strip('/'))
+        os.makedirs(page_dir, exist_ok=True)
+        root = '../' * len([p for p in path.strip('/').split('/') if p])
+        with open(os.path.join(page_dir, 'index.html'), 'w') as fh:
+            fh.write(PAGE.format(title=html_escape.escape(title or ''), stylesheets=stylesheets,
+                                 root=root, body=body))
+        for graph_id, text in renderer.exported.items():
+            with open(os.path.join(page_dir, graph_id + '.json'), 'w') as fh:
+                fh.write(text)
+        written.append((path, sorted(renderer.exported)))
+    return written
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Render a dashboard template to static files.')
+    parser.add_argument('template', help='template directory, e.g. multipage')
+    parser.add_argument('out', help='directory to write the site to')
+    args = parser.parse_args()
+    for path, graphs in export(args.template, args.out):
+        print(path, ', '.join(graphs))
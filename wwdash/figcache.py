@@ -0,0 +1,67 @@
+# Memoized figures.
+#
+# Between data refreshes a callback like seq_plot returns exactly the same
+# figure to every visitor, so it only needs to be built once per data
+# version. Figures are stored already serialized to JSON: a cache hit skips
+# building and validating the Plotly objects altogether and only has to parse
+# the JSON back into the plain dict that Dash sends to the browser. The JSON
+# comes from serialize.py, which keeps the data arrays as compact typed
+# arrays, so that parse is cheap too.
+#
+# Keys should contain the version of every dataset the figure is built from
+# (registry.version(name)) plus the inputs that change it, e.g.
+#   (registry.version('NICD_monthly'), 'monthly', start_date, end_date)
+# so a refresh never serves a stale figure. Old entries simply age out of the
+# LRU; WWDASH_FIGURE_CACHE_SIZE sets how many are kept (default: 64).
+
+import os
+import threading
+from collections import OrderedDict
+
+from .metrics import count, stage
+from .serialize import dumps, loads
+
+
+class FigureCache:
+
+    def __init__(self, maxsize=None):
+        self.maxsize = int(maxsize if maxsize is not None
+                           else os.environ.get('WWDASH_FIGURE_CACHE_SIZE', 64))
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get_json(self, key, build):
+        """Return the figure JSON for `key`, calling build() to make it on a miss."""
+        with self._lock:
+            text = self._entries.get(key)
+            if text is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                count('wwdash_figure_cache_total', result='hit')
+                return text
+        # built outside the lock, so a slow figure doesn't hold up the others.
+        # build() may return a go.Figure or a plain figure dict (see traces.py)
+        figure = build()
+        with stage('serialize'):
+            text = dumps(figure)
+        count('wwdash_figure_cache_total', result='miss')
+        with self._lock:
+            self.misses += 1
+            self._entries[key] = text
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+        return text
+
+    def get(self, key, build):
+        # a plain dict, which Dash serializes without going through Plotly's validators
+        return loads(self.get_json(key, build))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+figure_cache = FigureCache()
@@ -0,0 +1,332 @@
+# The figures shared by the templates.
+#
+# The wastewater levels chart (bar_chart) and the lineage prevalence chart
+# (seq_plot) used to be copied into every app, each copy with its own
+# tweaks. They are built here once, parameterized by dataset, dates and
+# options, so an optimization made here reaches every template:
+#
+#   levels_plot('rsa_cases_vs_levels', start, end)
+#   lineage_plot('NICD_daily_smoothed', 'daily', start, end, colors='color_map')
+#   lineage_plot('NICD_daily_smoothed', 'epiweek', start, end)    # rolled up, see rollup.py
+#   lag_plot('provincial_cases_vs_levels', 'Gauteng', bootstrap=1000)
+#
+# levels_figure/lineage_figure/lag_figure build a figure; the *_plot functions
+# return it through the figure cache, keyed by the data version and every
+# option, which is what a callback should send to the browser.
+
+from datetime import timedelta
+from itertools import cycle, islice
+
+import plotly.graph_objects as go
+from plotly.colors import qualitative
+from dash import Input, Output, callback, dcc
+from plotly.subplots import make_subplots
+
+from .aggregate import collapse_lineages
+from .downsample import downsample_frame
+from .figcache import figure_cache
+from .lag import MAX_LAG, lead_time
+from .metrics import stage, timed
+from .registry import registry
+from .rollup import RESOLUTIONS, ROLLED, period_window, rollup
+from .smoothing import smoothed
+from .store import store
+from .timeindex import time_indexed, window
+from .traces import figure_dict, stacked_traces
+
+LEVELS = 'rsa_cases_vs_levels'
+
+# the plottypes drawn as stacked bars: the hover format of a bar's date, and
+# half a bar's width in days (the x range is padded by that much)
+BARS = {
+    'epiweek': ('%Y, Epiweek %W', 4),
+    'monthly': ('%b %Y', 15),
+    'quarterly': ('Q%q %Y', 46),
+}
+
+
+@timed('levels_figure')
+def levels_figure(name=LEVELS, start=None, end=None, smoother='rolling', partition=None):
+    """Clinical cases (bars) against wastewater levels (markers and a smoothed line).
+
+    partition: optional (column, value) to only show one group of the
+        dataset, e.g. ('province', 'Gauteng').
+    """
+    # in our data, end is the end of the epiweek. The frame comes sorted by it, so picking
+    # the date range is a binary search and a slice rather than a scan (see timeindex.py).
+    # One site is read from the store with the dates and columns pushed down (see store.py)
+    if partition is None:
+        df = window(time_indexed(name), start, end)
+    else:
+        df = store.query(name, ['end', 'n', 'sum_genomes'], start, end, **{partition[0]: partition[1]})
+    # the smoothed levels are computed once per data version and only windowed here (see smoothing.py)
+    ww_smoothed = window(smoothed(name, 'sum_genomes', smoother, partition), start, end)
+    with stage('traces'):
+        return _levels_traces(df, ww_smoothed)
+
+
+def _levels_traces(df, ww_smoothed):
+    fig = make_subplots(specs=[[{"secondary_y": True}]])
+
+    fig.add_trace(
+        go.Bar(
+            x=df['end'], y=df['n'],
+            marker_color='lightgray',
+            name="Clinical",
+            hovertemplate='%{y} cases',
+            textposition = "none"),
+        secondary_y=False) #This will plot the clinical cases on the primary (left) y-axis
+
+    fig.add_trace(
+        go.Scatter(
+            x=df['end'], y=df['sum_genomes'],
+            mode='markers',
+            line=dict(color="cornflowerblue", width=4),
+            hovertemplate='%{y} copies/mL',
+            name="Wastewater"),
+            secondary_y=True)
+
+    fig.add_trace(
+        go.Scatter(
+            x=ww_smoothed.index, y=ww_smoothed.values,
+            mode='lines',
+            line=dict(color="cornflowerblue", width=4),
+            hovertemplate='%{y} copies/mL',
+            name="Smoothed wastewater"),
+            secondary_y=True) #The wastewater levels will be plotted on the secondary y-axis (right)
+
+    fig.update_layout(
+        template='none',
+        barmode='group',
+        legend=dict(
+            orientation="h",
+            yanchor="top",
+            y=-0.2,
+            xanchor="center",
+            x=0.5
+        ),
+    margin=dict(l=45, r=0, t=20, b=50))
+    fig.update_xaxes(hoverformat = "%Y, Epiweek %W",)
+    fig.update_yaxes(title_text="Laboratory confirmed cases",
+                     secondary_y=False,
+                     range=[0,df['n'].max()*1.02],
+                     showgrid=False,
+                     automargin=True,
+                     title_standoff=20  # Add space between y-axis label and graph
+                     )
+    fig.update_yaxes(title_text="Genome Copies/ml (N Gene)",
+                     secondary_y=True,
+                     range=[0,df['sum_genomes'].max()*1.02],
+                     automargin=True,
+                     title_standoff=20  # Add space between y-axis label and graph
+                     )
+    fig.update_traces(hoverinfo = 'name+y',cliponaxis=False)
+    return fig
+
+
+def levels_plot(name=LEVELS, start=None, end=None, smoother='rolling', partition=None):
+    key = (registry.version(name), 'levels', name, smoother, partition, start, end)
+    return figure_cache.get(key, lambda: levels_figure(name, start, end, smoother, partition))
+
+
+@timed('lag_figure')
+def lag_figure(result):
+    """The correlation of wastewater and cases at every lag (lag.cross_correlate's result)."""
+    import pandas as pd
+    table = result['lags']
+    fig = go.Figure()
+    if table['low'].notna().any():
+        # the bootstrap interval as a band: upper edge, then the lower edge filled up to it
+        fig.add_trace(go.Scatter(x=table.index, y=table['high'], mode='lines', line=dict(width=0),
+                                 hoverinfo='skip', showlegend=False))
+        fig.add_trace(go.Scatter(x=table.index, y=table['low'], mode='lines', line=dict(width=0),
+                                 fill='tonexty', fillcolor='rgba(100, 149, 237, 0.25)',
+                                 hoverinfo='skip', name='95% interval'))
+    fig.add_trace(go.Scatter(x=table.index, y=table['r'], mode='lines+markers',
+                             line=dict(color='cornflowerblue', width=3), name='Correlation',
+                             customdata=table['weeks'],
+                             hovertemplate='%{x} weeks: r = %{y:.2f} (%{customdata} weeks)<extra></extra>'))
+    if pd.notna(result['lead']):
+        fig.add_vline(x=result['lead'], line=dict(color='gray', dash='dot'))
+    fig.update_layout(
+        template='none',
+        legend=dict(orientation="h", yanchor="top", y=-0.2, xanchor="center", x=0.5),
+        margin=dict(l=45, r=0, t=20, b=50))
+    fig.update_xaxes(title_text="Weeks from wastewater to cases (positive: wastewater leads)", dtick=1,
+                     zeroline=True)
+    fig.update_yaxes(title_text="Correlation (r)", range=[-1, 1])
+    return fig
+
+
+def lag_plot(name=LEVELS, province=None, max_lag=MAX_LAG, bootstrap=0):
+    """lag_figure for a dataset (one province of it if given), through the figure cache."""
+    key = (registry.version(name), 'lag', name, province, max_lag, bootstrap)
+    return figure_cache.get(key, lambda: lag_figure(lead_time(name, province, max_lag, bootstrap)))
+
+
+def lead_summary(result):
+    """One sentence on the lead time in `result`, for under the lag chart."""
+    import pandas as pd
+    if pd.isna(result['lead']):
+        return 'Not enough weeks with both cases and wastewater levels to compare.'
+    lead = int(result['lead'])
+    if lead > 0:
+        text = f'Wastewater levels lead reported cases by {lead} week{"s" if lead != 1 else ""}'
+    elif lead < 0:
+        text = f'Wastewater levels trail reported cases by {-lead} week{"s" if lead != -1 else ""}'
+    else:
+        text = 'Wastewater levels and reported cases move in the same week'
+    if pd.notna(result['lead_low']):
+        text += f' (95% interval {result["lead_low"]:.0f} to {result["lead_high"]:.0f})'
+    return f'{text}: r = {result["r"]:.2f} over {result["weeks"]} weeks.'
+
+
+def _colors(colors, columns):
+    # a color per lineage, from a {lineage: color} Series (e.g. color_map) or a palette list
+    import pandas as pd
+    if isinstance(colors, pd.Series):
+        return colors.reindex(columns).fillna('lightgray')
+    # without a palette, plotly's default colors (an empty one would drop every trace)
+    return list(islice(cycle(colors or qualitative.Plotly), len(columns)))
+
+
+def _no_data(message):
+    # an empty chart with a note in the middle, rather than axes and a legend without traces
+    fig = go.Figure()
+    fig.add_annotation(text=message, showarrow=False, xref='paper', yref='paper', x=0.5, y=0.5,
+                       font={'size': 18})
+    fig.update_layout(template='none', margin=dict(l=40, r=75, t=15, b=0))
+    fig.update_xaxes(visible=False)
+    fig.update_yaxes(visible=False)
+    return figure_dict(fig, [])
+
+
+@timed('lineage_figure')
+def lineage_figure(frame, plottype, start=None, end=None, colors=(), threshold=0.01, groups=None,
+                   max_points=None, uirevision=None):
+    """Stacked lineage prevalence of a time-sorted (dates x lineages) frame.
+
+    plottype 'monthly' (or another of BARS) gives stacked bars, 'daily'
+    stacked areas (with at most `max_points` points per lineage, see
+    downsample.py). Lineages below
+    `threshold` are shown as "Other", after rolling them up with `groups`
+    (see aggregate.py). uirevision identifies the date range the user
+    picked (by default start-end): the user's zoom is kept while it stays the
+    same, e.g. when a zoom re-queries a narrower window.
+    """
+    import pandas as pd
+    names = {'variable':'Lineage', 'index':'Month', 'value':'Prevalence'}
+    seq_df = window(frame, start, end)
+    if not len(seq_df):
+        return _no_data('No data in selected range')
+    if plottype in BARS:
+        hoverformat, padding = BARS[plottype]
+        # (months without any sequencing data were dropped once at ingest, see normalize.py)
+        seq_df = collapse_lineages(seq_df, threshold=threshold, hierarchy=groups)
+        # all traces are built at once from the frame's values (see traces.py)
+        traces = stacked_traces(seq_df, _colors(colors, seq_df.columns), kind='bar')
+        fig2 = go.Figure()
+
+        # set bar mode to stack and configure to desired format
+        fig2.update_layout(barmode='stack',yaxis_tickformat = '.0%')
+        fig2.update_layout(legend_title_text=names['variable'])
+        fig2.update_xaxes(title_text="",hoverformat = hoverformat)
+        if start is not None and end is not None:
+            fig2.update_layout(xaxis_range=[pd.to_datetime(start)-timedelta(days=padding), pd.to_datetime(end)+timedelta(days=padding)])
+        fig2.update_layout(template='none')
+    else:
+        seq_df = collapse_lineages(seq_df, threshold=threshold, hierarchy=groups)
+        seq_df = downsample_frame(seq_df, max_points)
+
+        traces = stacked_traces(seq_df, _colors(colors, seq_df.columns), kind='area')
+        fig2 = go.Figure()
+        fig2.update_layout(legend_title_text=names['variable'],hovermode='x unified',hoverlabel=dict(font_size=12), yaxis_tickformat = '.0%')
+        # uirevision keeps the user's zoom when the zoomed-in data comes back, and resets
+        # it when other dates are picked
+        fig2.update_layout(xaxis_range=[start, end], template='none',
+                           uirevision=uirevision or f'{start}/{end}')
+        fig2.update_xaxes(title_text="",hoverformat = "%b %d %Y")
+    fig2.update_layout(
+        legend=dict(
+        orientation="h",
+            yanchor="top",
+            y=-0.2,
+            xanchor="center",
+            x=0.5,
+        font={'size':15}
+    ),margin=dict(l=40, r=75, t=15, b=0))
+
+    fig2.update_yaxes(title_text="Lineage Prevalence",
+                      range=[0,1.01],
+                      automargin=True,
+                      title_standoff=20
+    )
+    return figure_dict(fig2, traces)
+
+
+def _key(value):
+    # cache key part for lineage_plot options
+    import pandas as pd
+    if isinstance(value, dict):
+        return tuple(sorted(value.items()))
+    if isinstance(value, (list, pd.Series)):
+        return tuple(value)
+    return value
+
+
+def lineage_plot(name, plottype, start=None, end=None, colors=(), threshold=0.01, groups=None,
+                 max_points=None, frame=None, variant=None, uirevision=None):
+    """lineage_figure for a registered dataset, through the figure cache.
+
+    colors may also be the name of a registered {lineage: color} dataset
+    such as 'color_map', whose version then becomes part of the key.
+    frame: optionally a frame derived from `name` to plot instead of the
+        dataset itself (e.g. one province), identified in the key by `variant`,
+        or a function returning it, which is then only called on a cache miss.
+    A daily dataset (rollup.ROLLED) shown as 'epiweek', 'monthly' or
+    'quarterly' is plotted from its rollup.
+    """
+    if frame is None and name in ROLLED and plottype in RESOLUTIONS:
+        frame = lambda: rollup(name, plottype)
+        # every period the picked dates overlap, including a partial first and last one
+        start, end = period_window(plottype, start, end)
+    key = [registry.version(name), 'lineages', name, variant, plottype, start, end,
+           threshold, _key(groups), max_points, uirevision]
+    if isinstance(colors, str):
+        key.append(registry.version(colors))
+        colors = registry.get(colors)
+    else:
+        key.append(_key(colors))
+
+    def build():
+        source = time_indexed(name) if frame is None else frame() if callable(frame) else frame
+        return lineage_figure(source, plottype, start, end, colors, threshold, groups, max_points,
+                              uirevision)
+
+    return figure_cache.get(tuple(key), build)
+
+
+def date_picker(id, dataset=None, start_date=None, end_date=None):
+    # only dates that are in the data can be picked. Without a dataset the bounds are left
+    # to date_bounds(), so the layout can be sent without loading the data first
+    picker = dcc.DatePickerRange(
+        id=id,
+        start_date=start_date,
+        end_date=end_date,
+        display_format='D MMM YYYY')
+    if dataset is not None:
+        picker.min_date_allowed, picker.max_date_allowed = _bounds(dataset)
+    return picker
+
+
+def _bounds(dataset):
+    first, last = store.bounds(dataset)
+    return first.date(), last.date()
+
+
+def date_bounds(id, dataset):
+    """Register a callback that sets date picker `id`'s bounds once the page is shown."""
+    callback(
+        Output(id, 'min_date_allowed'),
+        Output(id, 'max_date_allowed'),
+        Input(id, 'id'))(lambda _: _bounds(dataset))
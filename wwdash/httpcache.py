@@ -0,0 +1,191 @@
+# HTTP validators for the pages, layouts and callback responses.
+#
+# Between two data refreshes a callback answers the same inputs with the same
+# figure for every visitor, and the pages, their layouts and the data API's
+# exports (api.py) don't change at all. http_cache(server) gives these
+# responses an ETag made of what was asked for (the path, and for a callback
+# its request body, i.e. its inputs) and the versions of the datasets the
+# response was built from, which the registry records while the request runs.
+# The next time the same request comes in, the tag is worked out from the
+# versions of the registry's current snapshots of those datasets before
+# anything runs, the same versions the response would be built from, so a
+# request whose If-None-Match still matches is answered with an empty 304
+# before Dash runs anything. Tags only depend on what was asked for and the
+# versions, so every worker gives the same response the same tag. Cache-Control headers let browsers and shared caches reuse it:
+#
+#   from wwdash import http_cache
+#   http_cache(app.server)
+#
+# Browsers may reuse a response for WWDASH_HTTP_MAX_AGE seconds (default: 60)
+# and a CDN or reverse proxy for WWDASH_HTTP_SHARED_MAX_AGE seconds (default:
+# 300), serving it stale for as long again while they revalidate. Pages are
+# private to the browser: Dash writes a token for each page load into them,
+# which it also adds to every callback URL (endId, left out of the ETag).
+# Background callbacks (background.py) aren't cached, since their first
+# answer is a job to poll rather than the result. Callbacks
+# are POST requests, which browsers and most CDNs don't store by default; a
+# proxy that does (e.g. nginx with proxy_cache_methods POST) must have the
+# request body in its cache key. The ETag also changes with the code, through
+# the modification times of wwdash and the app's files (or WWDASH_RELEASE if
+# set, e.g. to a git commit), so a deploy doesn't leave old figures behind.
+# Set WWDASH_HTTP_CACHE=0 to turn it off.
+
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+from . import env_flag
+from .metrics import count
+from .registry import registry as default_registry
+
+ENABLED = env_flag('WWDASH_HTTP_CACHE', default=True)
+MAX_AGE = int(os.environ.get('WWDASH_HTTP_MAX_AGE', 60))
+SHARED_MAX_AGE = int(os.environ.get('WWDASH_HTTP_SHARED_MAX_AGE', 300))
+# requests whose datasets are remembered, per worker
+MAX_REQUESTS = 4096
+
+# the Dash routes that only depend on the data and the request; the rest are static files
+# Dash fingerprints itself, the dev-mode reload hash and our own /metrics
+CALLBACK = '_dash-update-component'
+ROUTES = ('_dash-layout', '_dash-dependencies')
+
+
+def _release(server):
+    # newest modification time of the Python files of wwdash and of the app (pages included)
+    release = os.environ.get('WWDASH_RELEASE')
+    if release:
+        return release
+    newest = 0.0
+    for top in (os.path.dirname(os.path.abspath(__file__)), server.root_path):
+        for directory, subdirectories, files in os.walk(top):
+            subdirectories[:] = [d for d in subdirectories if not d.startswith(('.', '__'))]
+            newest = max([newest] + [os.path.getmtime(os.path.join(directory, f))
+                                     for f in files if f.endswith('.py')])
+    return str(newest)
+
+
+def _background(request):
+    # a background callback's job, or a poll for its result
+    if 'cacheKey' in request.args:
+        return True
+    from dash import get_app
+    output = (request.get_json(silent=True) or {}).get('output')
+    return bool(get_app().callback_map.get(output, {}).get('background'))
+
+
+def _kind(request):
+    # 'callback', 'layout' (the layout and callback list), 'page' or 'data' (api.py);
+    # None for anything not cached
+    endpoint = request.endpoint or ''
+    if endpoint.startswith('wwdash_data'):
+        return 'data' if request.method in ('GET', 'HEAD') else None
+    if request.method == 'POST':
+        return 'callback' if endpoint.endswith(CALLBACK) and not _background(request) else None
+    if request.method not in ('GET', 'HEAD'):
+        return None
+    if endpoint.endswith(ROUTES):
+        return 'layout'
+    # Dash's index routes, '/' and '/<path:path>' (the pages of a multipage app)
+    if endpoint.endswith('/') or endpoint.endswith('<path:path>'):
+        return 'page'
+    return None
+
+
+def http_cache(server, registry=None):
+    """Add ETags and Cache-Control to the Flask `server`'s Dash responses (unless WWDASH_HTTP_CACHE=0)."""
+    if not ENABLED:
+        return server
+    from flask import Response, request
+    registry = registry or default_registry
+    release = _release(server)
+    cache_control = f'public, max-age={MAX_AGE}, s-maxage={SHARED_MAX_AGE}, ' \
+                    f'stale-while-revalidate={SHARED_MAX_AGE}'
+    private = f'private, max-age={MAX_AGE}'
+
+    # request -> the datasets its response was built from, learned when it was first answered
+    datasets = OrderedDict()
+    lock = threading.Lock()
+
+    def request_key():
+        # what was asked for: the path, the query without the page load's token, and a callback's inputs
+        digest = hashlib.sha1()
+        query = sorted((k, v) for k, v in request.args.items(multi=True) if k != 'endId')
+        digest.update(f'{request.path}?{query}\0'.encode())
+        if request.method == 'POST':
+            digest.update(request.get_data(cache=True))
+        return digest.digest()
+
+    def etag(key, versions):
+        digest = hashlib.sha1(release.encode())
+        for name, version in sorted(versions.items()):
+            digest.update(f'\0{name}={version}'.encode())
+        digest.update(key)
+        return digest.hexdigest()[:20]
+
+    def remember(key, names):
+        with lock:
+            datasets[key] = names
+            datasets.move_to_end(key)
+            while len(datasets) > MAX_REQUESTS:
+                datasets.popitem(last=False)
+
+    def headers(response, tag, kind):
+        # weak: the gzip and brotli bodies of the same response are equivalent, not equal
+        response.set_etag(tag, weak=True)
+        response.headers['Cache-Control'] = private if kind == 'page' else cache_control
+        response.vary.add('Accept-Encoding')
+        return response
+
+    def not_modified(tag, kind):
+        count('wwdash_http_cache_total', kind=kind, result='not_modified')
+        return headers(Response(status=304), tag, kind)
+
+    def before():
+        kind = _kind(request)
+        if kind is None:
+            return None
+        if request.if_none_match:
+            response = validate(kind)
+            if response is not None:
+                return response
+        # record the datasets this request reads, for its tag (see after)
+        registry.track()
+        return None
+
+    def validate(kind):
+        key = request_key()
+        with lock:
+            names = datasets.get(key)
+        if names is None:
+            # not answered by this worker yet: after() compares the tag once it is known
+            return None
+        # the snapshots this worker would build the response from, like after() (not the host's
+        # cache, which can be a refresh ahead of them and would give old data the new tag)
+        tag = etag(key, {name: registry.version(name) for name in names})
+        if request.if_none_match.contains_weak(tag):
+            return not_modified(tag, kind)
+        return None
+
+    def after(response):
+        kind = _kind(request)
+        if kind is None:
+            return response
+        # the versions the response was built from: this worker's snapshots, which can be a refresh
+        # behind the host's cache for a moment, and then must not get the newer data's tag
+        versions = registry.tracked()
+        if response.status_code != 200 or 'ETag' in response.headers:
+            return response
+        key = request_key()
+        remember(key, tuple(sorted(versions)))
+        tag = etag(key, versions)
+        if request.if_none_match:
+            if request.if_none_match.contains_weak(tag):
+                # the callback ran (this worker hadn't seen the request), but the body needn't be sent
+                return not_modified(tag, kind)
+            count('wwdash_http_cache_total', kind=kind, result='modified')
+        return headers(response, tag, kind)
+
+    server.before_request(before)
+    server.after_request(after)
+    return server
@@ -0,0 +1,136 @@
+# How far the wastewater levels run ahead of the clinical cases.
+#
+# The levels chart overlays weekly cases (n) and wastewater levels
+# (sum_genomes) but doesn't say by how much one leads the other. lead_time()
+# correlates the wastewater level of every epiweek with the cases `lag`
+# weeks later, for every lag from -max_lag to max_lag at once: the cases are
+# shifted into a (lags x weeks) array and all the correlations are computed in
+# one vectorized pass. Both series are compared on a log scale, since they
+# span orders of magnitude. The lead time is the lag with the highest
+# correlation; a positive lead means the wastewater moves first.
+#
+# With bootstrap=N, N moving-block resamples of the weeks (blocks of BLOCK
+# weeks, which keeps the autocorrelation of the series within a block) give
+# 95% intervals for every correlation and for the lead time. All resamples
+# go through the same vectorized pass, as a (lags x resamples x weeks) array.
+#
+#   lead_time('rsa_cases_vs_levels', max_lag=6, bootstrap=1000)
+#   lead_time('provincial_cases_vs_levels', province='Gauteng')
+#
+# Results are memoized per data version (registry.memo), so the bootstrap
+# runs once per dataset, province and settings until the data changes.
+
+import warnings
+
+import numpy as np
+
+from .metrics import timed
+from .registry import registry as default_registry
+from .store import DatasetStore, store as default_store
+from .timeindex import time_indexed
+
+MAX_LAG = 6
+BLOCK = 4
+# fewer overlapping weeks than this and a correlation isn't reported
+MIN_PAIRS = 8
+LEVEL = 0.95
+
+
+def _shifted(y, lags):
+    # row i holds y moved back by lags[i] weeks: column t is y[t + lags[i]], NaN past either end
+    positions = np.arange(len(y))[None, :] + lags[:, None]
+    inside = (positions >= 0) & (positions < len(y))
+    return np.where(inside, y[np.clip(positions, 0, len(y) - 1)], np.nan)
+
+
+def correlations(x, y):
+    """Pearson correlations of x and y along their last axis, ignoring weeks where either is NaN.
+
+    x and y are broadcast against each other, so one x can be compared with
+    many shifted ys (and resamples) at once.
+    """
+    x, y = np.broadcast_arrays(x, y)
+    pairs = ~(np.isnan(x) | np.isnan(y))
+    count = pairs.sum(axis=-1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        dx = np.where(pairs, x, 0.0)
+        dy = np.where(pairs, y, 0.0)
+        dx = np.where(pairs, dx - (dx.sum(axis=-1) / count)[..., None], 0.0)
+        dy = np.where(pairs, dy - (dy.sum(axis=-1) / count)[..., None], 0.0)
+        r = (dx * dy).sum(axis=-1) / np.sqrt((dx * dx).sum(axis=-1) * (dy * dy).sum(axis=-1))
+    return np.where(count >= MIN_PAIRS, r, np.nan), count
+
+
+def _block_resamples(weeks, count, block, rng):
+    # `count` moving-block bootstrap resamples of range(weeks), as a (count x weeks) index array
+    block = max(1, min(block, weeks))
+    starts = rng.integers(0, weeks - block + 1, size=(count, -(-weeks // block)))
+    return (starts[:, :, None] + np.arange(block)).reshape(count, -1)[:, :weeks]
+
+
+def _best(r, lags):
+    # the lag of the highest correlation along the first axis (NaN where there is none)
+    valid = ~np.isnan(r).all(axis=0)
+    best = np.nanargmax(np.where(valid, r, -np.inf), axis=0)
+    return np.where(valid, lags[best], np.nan)
+
+
+@timed('lag')
+def cross_correlate(wastewater, cases, max_lag=MAX_LAG, bootstrap=0, block=BLOCK, seed=0):
+    """Lagged correlations between two weekly series of the same weeks.
+
+    Returns a dict with 'lags', a frame indexed by lag (cases `lag` weeks
+    after the wastewater) with the correlation r, its interval low/high and
+    the number of weeks compared; 'lead', the lag of the highest correlation,
+    with 'lead_low'/'lead_high'; 'r' at that lag and 'weeks'. Intervals are
+    NaN without bootstrap.
+    """
+    import pandas as pd
+    x = np.log1p(np.asarray(wastewater, dtype='float64'))
+    y = np.log1p(np.asarray(cases, dtype='float64'))
+    lags = np.arange(-max_lag, max_lag + 1)
+    shifted = _shifted(y, lags)
+    r, count = correlations(x, shifted)
+    table = pd.DataFrame({'r': r, 'low': np.nan, 'high': np.nan, 'weeks': count},
+                         index=pd.Index(lags, name='lag'))
+    result = {'lags': table, 'lead': float(_best(r, lags)), 'r': np.nanmax(r) if np.isfinite(r).any() else np.nan,
+              'lead_low': np.nan, 'lead_high': np.nan, 'weeks': int(np.sum(~np.isnan(x) & ~np.isnan(y)))}
+    if bootstrap and len(x):
+        rng = np.random.default_rng(seed)
+        resamples = _block_resamples(len(x), bootstrap, block, rng)
+        # (lags x resamples x weeks): every lag of every resample in one pass
+        r_boot, _ = correlations(x[resamples][None, :, :], shifted[:, resamples])
+        tail = (1 - LEVEL) / 2 * 100
+        with warnings.catch_warnings():
+            # lags with too few weeks are all NaN, which nanpercentile warns about
+            warnings.simplefilter('ignore', RuntimeWarning)
+            table['low'], table['high'] = np.nanpercentile(r_boot, [tail, 100 - tail], axis=1)
+            leads = _best(r_boot, lags)
+            if np.isfinite(leads).any():
+                result['lead_low'], result['lead_high'] = np.nanpercentile(leads, [tail, 100 - tail])
+    return result
+
+
+def weekly(name, province=None, registry=None):
+    """The weekly cases (n) and wastewater levels (sum_genomes) of `name`, one row per epiweek.
+
+    Weeks missing from the data are NaN rows, so that shifting by k rows is shifting by k weeks.
+    """
+    registry = registry or default_registry
+    if province is None:
+        df = time_indexed(name, registry)[['n', 'sum_genomes']]
+    else:
+        store = default_store if registry is default_registry else DatasetStore(registry)
+        df = store.query(name, ['end', 'n', 'sum_genomes'], province=province)[['n', 'sum_genomes']]
+    df = df[~df.index.duplicated()]
+    return df.asfreq('7D') if len(df) else df
+
+
+def lead_time(name, province=None, max_lag=MAX_LAG, bootstrap=0, registry=None):
+    """cross_correlate() for dataset `name` (one province of it if given), once per data version."""
+    registry = registry or default_registry
+
+    def build(snap):
+        df = weekly(name, province, registry)
+        return cross_correlate(df['sum_genomes'], df['n'], max_lag, bootstrap)
+    return registry.memo(name, ('lead_time', province, max_lag, bootstrap), build)
@@ -0,0 +1,205 @@
+# Timing of the hot paths, exposed to Prometheus.
+#
+# With WWDASH_METRICS=1, the stages of serving a figure are timed into
+# histograms: downloading and normalizing a dataset, loading it, building
+# its derived data (time index, partitions, smoothing), filtering the date
+# range, aggregating lineages, building the traces and serializing the
+# figure. Each callback is timed as a whole too, and the figure cache and
+# derived-data hits and misses are counted. instrument(server) puts all of
+# it on a /metrics route in the Prometheus text format:
+#
+#   from wwdash import instrument
+#   instrument(app.server)
+#
+# WWDASH_SERVER_TIMING=1 also adds a Server-Timing header to every callback
+# response, so the browser's dev tools show where its time went.
+#
+# Both are off by default, and then cost next to nothing: timed() returns the
+# function unchanged, stage() a shared no-op context manager and count() returns
+# straight away. The numbers are per process; with several gunicorn workers
+# every scrape sees the worker that happened to answer it.
+
+import bisect
+import contextlib
+import functools
+import threading
+import time
+
+from . import env_flag
+
+SERVER_TIMING = env_flag('WWDASH_SERVER_TIMING')
+ENABLED = env_flag('WWDASH_METRICS') or SERVER_TIMING
+
+# histogram buckets in seconds (Prometheus' defaults, plus finer ones for the quick stages)
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+HELP = {
+    'wwdash_stage_seconds': ('histogram', 'Time spent in each stage of loading data and building figures.'),
+    'wwdash_callback_seconds': ('histogram', 'Time to answer a Dash callback, by output.'),
+    'wwdash_figure_cache_total': ('counter', 'Figure cache lookups, by result.'),
+    'wwdash_derived_total': ('counter', 'Lookups of data derived from a dataset, by kind and result.'),
+    'wwdash_fetch_total': ('counter', 'Dataset fetches, by dataset and status.'),
+    'wwdash_data_api_total': ('counter', 'Data API exports, by dataset and format.'),
+    'wwdash_http_cache_total': ('counter', 'Conditional requests (If-None-Match), by kind and result.'),
+    'wwdash_dataset_rows': ('gauge', 'Rows in the loaded version of a dataset.'),
+    'wwdash_dataset_bytes': ('gauge', 'Size of the loaded version of a dataset (Arrow buffers).'),
+}
+
+
+class Metrics:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # (metric, labels) -> [bucket counts..., sum, count] for histograms, a number otherwise
+        self._values = {}
+
+    def observe(self, metric, labels, seconds):
+        key = (metric, labels)
+        with self._lock:
+            values = self._values.get(key)
+            if values is None:
+                values = self._values[key] = [0] * (len(BUCKETS) + 2)
+            i = bisect.bisect_left(BUCKETS, seconds)
+            if i < len(BUCKETS):
+                values[i] += 1
+            values[-2] += seconds
+            values[-1] += 1
+
+    def inc(self, metric, labels, amount=1):
+        key = (metric, labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def set(self, metric, labels, value):
+        with self._lock:
+            self._values[(metric, labels)] = value
+
+    def render(self):
+        """Everything recorded so far, in the Prometheus text format."""
+        with self._lock:
+            values = {key: list(v) if isinstance(v, list) else v for key, v in self._values.items()}
+        lines = []
+        for metric in sorted({metric for metric, _ in values}):
+            kind, text = HELP.get(metric, ('untyped', metric))
+            lines += [f'# HELP {metric} {text}', f'# TYPE {metric} {kind}']
+            for (name, labels), value in sorted(values.items()):
+                if name != metric:
+                    continue
+                if kind == 'histogram':
+                    cumulative = 0
+                    for bound, n in zip(BUCKETS, value):
+                        cumulative += n
+                        lines.append(f'{metric}_bucket{_labels(labels, le=repr(bound))} {cumulative}')
+                    lines.append(f'{metric}_bucket{_labels(labels, le="+Inf")} {value[-1]}')
+                    lines.append(f'{metric}_sum{_labels(labels)} {value[-2]!r}')
+                    lines.append(f'{metric}_count{_labels(labels)} {value[-1]}')
+                else:
+                    lines.append(f'{metric}{_labels(labels)} {value!r}')
+        return '\n'.join(lines) + '\n'
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+
+
+def _labels(labels, **extra):
+    pairs = list(labels) + list(extra.items())
+    if not pairs:
+        return ''
+    escaped = (str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, v in pairs)
+    return '{' + ','.join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + '}'
+
+
+metrics = Metrics()
+
+# the stage timings of the request being handled on this thread, for Server-Timing
+_request = threading.local()
+
+
+class _Stage:
+    __slots__ = ('name', 'started')
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        seconds = time.perf_counter() - self.started
+        metrics.observe('wwdash_stage_seconds', (('stage', self.name),), seconds)
+        timings = getattr(_request, 'timings', None)
+        if timings is not None:
+            timings.append((self.name, seconds))
+        return False
+
+
+_NOOP = contextlib.nullcontext()
+
+
+def stage(name):
+    """with stage('filter'): ...  times the block as stage `name`."""
+    return _Stage(name) if ENABLED else _NOOP
+
+
+def timed(name):
+    """Decorator timing every call of a function as stage `name`."""
+    def decorate(fn):
+        if not ENABLED:
+            return fn
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with _Stage(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def count(metric, **labels):
+    if ENABLED:
+        metrics.inc(metric, tuple(sorted(labels.items())))
+
+
+def gauge(metric, value, **labels):
+    if ENABLED:
+        metrics.set(metric, tuple(sorted(labels.items())), value)
+
+
+def instrument(server):
+    """Time the Dash callbacks served by the Flask `server` and add the /metrics route.
+
+    Does nothing unless WWDASH_METRICS or WWDASH_SERVER_TIMING is set.
+    """
+    if not ENABLED:
+        return server
+    from flask import Response, request
+
+    def before():
+        if request.path.endswith('_dash-update-component'):
+            _request.timings = []
+            _request.started = time.perf_counter()
+
+    def after(response):
+        timings = getattr(_request, 'timings', None)
+        if timings is None:
+            return response
+        seconds = time.perf_counter() - _request.started
+        _request.timings = None
+        body = request.get_json(silent=True) or {}
+        metrics.observe('wwdash_callback_seconds', (('output', body.get('output', '')),), seconds)
+        if SERVER_TIMING:
+            # milliseconds, summed per stage (a stage can run more than once per callback)
+            totals = {}
+            for name, stage_seconds in timings:
+                totals[name] = totals.get(name, 0.0) + stage_seconds
+            entries = [f'{name};dur={s * 1000:.2f}' for name, s in totals.items()]
+            response.headers['Server-Timing'] = ', '.join(entries + [f'total;dur={seconds * 1000:.2f}'])
+        return response
+
+    server.before_request(before)
+    server.after_request(after)
+    server.add_url_rule('/metrics', 'wwdash_metrics',
+                        lambda: Response(metrics.render(), mimetype='text/plain; version=0.0.4'))
+    return server
@@ -0,0 +1,84 @@
+# Compact dtypes, applied once when a dataset is downloaded (see cache.py).
+#
+# The upstream files come as float64 prevalences and plain strings, and
+# every worker maps them in as they are. Before a download is written to the
+# cache it is normalized instead:
+#
+# - lineage prevalences are stored as float32 (plenty for a fraction shown
+#   as a percentage, and half the memory and half the figure payload);
+# - string columns with few distinct values (provinces, lineage names,
+#   dates of the long-format files) become categoricals;
+# - in the wide (dates x lineages) frames, lineages that are zero throughout
+#   and dates without any sequencing data are dropped, so the figures don't
+#   have to filter them on every request.
+#
+# The memory use before and after is logged and kept in the dataset's meta.
+
+import logging
+
+import pyarrow as pa
+
+from .metrics import timed
+
+log = logging.getLogger(__name__)
+
+# datasets with lineage prevalences: None means every float column is one (a
+# wide frame of dates x lineages), otherwise the names of the columns that are
+PREVALENCES = {
+    'NICD_monthly': None,
+    'NICD_daily_smoothed': None,
+    'merged_data_exploded': ['abundances'],
+}
+
+# strings become categoricals if they have at most this many distinct values per row
+CATEGORICAL_RATIO = 0.5
+
+# bumped whenever normalize() changes, so older cache files get normalized again
+FORMAT = 1
+
+
+def memory(frame):
+    return int(frame.memory_usage(deep=True, index=True).sum())
+
+
+def normalize_frame(name, frame):
+    """The normalized copy of `frame`, and what was done to it."""
+    import pandas as pd
+    before = memory(frame)
+    frame = frame.copy()
+    report = {'memory_before': before, 'dropped_columns': 0, 'dropped_rows': 0}
+
+    if name in PREVALENCES:
+        columns = PREVALENCES[name]
+        if columns is None:
+            columns = [c for c in frame.columns if pd.api.types.is_float_dtype(frame[c])]
+            values = frame[columns].to_numpy(dtype='float64', na_value=0.0)
+            keep_columns = (values != 0).any(axis=0)
+            keep_rows = values.sum(axis=1) > 0
+            dropped = [c for c, keep in zip(columns, keep_columns) if not keep]
+            frame = frame.drop(columns=dropped)[keep_rows]
+            columns = [c for c in columns if c not in dropped]
+            report['dropped_columns'] = len(dropped)
+            report['dropped_rows'] = int((~keep_rows).sum())
+        columns = [c for c in columns if c in frame.columns]
+        frame[columns] = frame[columns].astype('float32')
+
+    for column in frame.columns:
+        series = frame[column]
+        if (pd.api.types.is_object_dtype(series) or pd.api.types.is_string_dtype(series)) \
+                and not isinstance(series.dtype, pd.CategoricalDtype) and len(series):
+            if series.nunique() <= CATEGORICAL_RATIO * len(series):
+                frame[column] = series.astype('category')
+
+    report['memory_after'] = memory(frame)
+    return frame, report
+
+
+@timed('normalize')
+def normalize(name, table):
+    """normalize_frame for an Arrow table (as decoded from the upstream file)."""
+    frame, report = normalize_frame(name, table.to_pandas())
+    log.info('normalized %s: %.2f MB -> %.2f MB in memory (%d lineages, %d dates dropped)',
+             name, report['memory_before'] / 1e6, report['memory_after'] / 1e6,
+             report['dropped_columns'], report['dropped_rows'])
+    return pa.Table.from_pandas(frame), report
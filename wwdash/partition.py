@@ -0,0 +1,32 @@
+# Splitting a dataset into per-group sub-frames (e.g. one per province).
+#
+# Filtering df[df['province'] == p] scans the whole table on every callback.
+# partition_by sorts the table by group once, keeping the time order within
+# each group, and returns {group: sub-frame}, where every sub-frame is a
+# slice of that one sorted table. Selecting a province is then a dict lookup,
+# and a date range inside it is a window() on its sorted index.
+
+import numpy as np
+
+from .registry import registry as default_registry
+from .timeindex import TIME_COLUMNS, sort_by_time
+
+
+def partition_by(frame, column):
+    """{value of `column`: rows with that value}, in order of first sort."""
+    import pandas as pd
+    codes, groups = pd.factorize(frame[column], sort=True)
+    order = np.argsort(codes, kind='stable')
+    frame = frame.iloc[order]
+    bounds = np.searchsorted(codes[order], np.arange(len(groups) + 1))
+    return {group: frame.iloc[bounds[i]:bounds[i + 1]] for i, group in enumerate(groups)}
+
+
+def partitioned(name, column, registry=None):
+    """partition_by for a registered dataset, time-sorted, once per data version."""
+    registry = registry or default_registry
+
+    def build(frame):
+        return partition_by(sort_by_time(frame, TIME_COLUMNS.get(name)), column)
+
+    return registry.derived(name, ('partition', column), build)
@@ -0,0 +1,93 @@
+# Background refresh of the datasets.
+#
+# A daemon thread polls upstream every WWDASH_REFRESH_INTERVAL seconds
+# (default: 900) and swaps new versions into the registry as they appear, so
+# the layouts and callbacks never wait on a download. A refresh that fails
+# (upstream down, a truncated file, ...) is logged and the last good snapshot
+# keeps being served.
+#
+# Starting up never waits on the network: start_refresher loads whatever is
+# in the local cache and the thread revalidates it straight away, so a worker
+# can accept connections within about a second of being started.
+#
+# Besides the datasets it was started with, the refresher keeps whatever else
+# the app has loaded so far up to date (e.g. a dataset that is only read
+# through /api/data), since requests leave revalidation to it once it runs.
+# Without a list of names, datasets are only loaded once something uses them.
+#
+# Threads don't survive a fork, so with `gunicorn --preload` start the
+# refresher from a post_fork hook instead of at import time.
+
+import logging
+import os
+import threading
+
+from .cache import format_report
+from .registry import registry as default_registry
+
+log = logging.getLogger(__name__)
+
+
+class Refresher(threading.Thread):
+
+    def __init__(self, names, interval=None, registry=None):
+        super().__init__(name='wwdash-refresher', daemon=True)
+        self.names = list(names) if names is not None else None
+        self.interval = float(interval if interval is not None
+                              else os.environ.get('WWDASH_REFRESH_INTERVAL', 900))
+        self.registry = registry or default_registry
+        self._stopping = threading.Event()
+        # the first check is made as soon as the thread starts, unless start_refresher already did
+        self.checked = False
+
+    def refresh_once(self):
+        # all datasets are checked at once, so a round takes as long as the slowest one
+        loaded = self.registry.loaded()
+        names = loaded if self.names is None else self.names + [name for name in loaded if name not in self.names]
+        changed, report = self.registry.refresh_all(names)
+        for entry in report:
+            if entry['error'] is not None:
+                log.error('refreshing %s failed, keeping the current snapshot: %s', entry['name'], entry['error'])
+        log.debug('refresh round:\n%s', format_report(report))
+        if changed:
+            log.info('refreshed %s', ', '.join(changed))
+        self.checked = True
+        return changed
+
+    def run(self):
+        if not self.checked:
+            self.refresh_once()
+        while not self._stopping.wait(self.interval):
+            self.refresh_once()
+
+    def stop(self):
+        self._stopping.set()
+
+
+_refresher = None
+
+
+def start_refresher(names=None, interval=None, registry=None, warm=True, wait=False):
+    """Start the background refresher for this process (only once).
+
+    With warm=True the local copies of the datasets are loaded before
+    returning (memory-mapped, so this is quick), and checked upstream from the
+    thread; a dataset without a local copy is downloaded there or on first use.
+    wait=True checks (and downloads) them all before returning instead, which
+    can take seconds. With names=None nothing is loaded up front; datasets are
+    loaded on first use and refreshed after that.
+    """
+    global _refresher
+    if _refresher is None:
+        _refresher = Refresher(names, interval, registry)
+        if wait:
+            _refresher.refresh_once()
+        elif warm:
+            for name in _refresher.names or ():
+                try:
+                    _refresher.registry.preload(name)
+                except Exception:
+                    log.exception('could not load the local copy of %s', name)
+        _refresher.registry.background = True
+        _refresher.start()
+    return _refresher
@@ -0,0 +1,218 @@
+# Process-wide registry of the loaded datasets.
+#
+# The cache (cache.py) keeps one uncompressed Arrow file per dataset on the
+# host. Every worker memory-maps that file and wraps the mapped buffers in a
+# DataFrame without copying them, so N gunicorn workers share one copy of the
+# data through the OS page cache instead of holding N private ones. The frames
+# handed out are read-only views: pandas copies on write, so callbacks can
+# filter and add columns as usual but can never change the shared data.
+#
+# A snapshot only becomes a DataFrame when something asks for its frame.
+# Datasets that are only queried through the partitioned store (store.py)
+# stay an Arrow table, mapped in but never converted.
+
+import logging
+import threading
+import time
+
+from .cache import SOURCES, cache as default_cache
+from .metrics import count, gauge, stage, timed
+
+log = logging.getLogger(__name__)
+
+
+class Snapshot:
+    """One loaded version of a dataset."""
+
+    def __init__(self, name, version, table):
+        self.name = name
+        self.version = version
+        # memory-mapped when the snapshot is made, so it stays this version's data
+        # even after a refresh has replaced the file
+        self.table = table
+        self.checked_at = time.time()
+        # things computed from this version of the data, see DatasetRegistry.derived
+        self.derived = {}
+        self._frame = None
+        self._lock = threading.Lock()
+
+    @property
+    def frame(self):
+        if self._frame is None:
+            with self._lock:
+                if self._frame is None:
+                    self._frame = _to_frame(self.name, self.table)
+        return self._frame
+
+
+@timed('to_pandas')
+def _to_frame(name, table):
+    # split_blocks keeps every column in its own block, so numeric columns
+    # stay views of the memory map rather than being consolidated (copied)
+    frame = table.to_pandas(split_blocks=True)
+    if SOURCES[name].endswith('.json'):
+        frame = frame['value'].rename(None)
+    return frame
+
+
+class DatasetRegistry:
+
+    def __init__(self, cache=None):
+        self.cache = cache or default_cache
+        self._snapshots = {}
+        self._lock = threading.Lock()
+        self._listeners = []
+        # the snapshots _swap is warming in this thread, before anyone else can see them
+        self._warming = threading.local()
+        # the datasets read by this thread since track(), see tracked()
+        self._reads = threading.local()
+        # set by the background refresher (refresh.py), which then owns revalidation
+        self.background = False
+
+    @timed('load')
+    def _load(self, name, local=False):
+        table = self.cache.read_table(name, local)
+        gauge('wwdash_dataset_rows', table.num_rows, dataset=name)
+        gauge('wwdash_dataset_bytes', table.nbytes, dataset=name)
+        return Snapshot(name, self.cache.meta(name).get('version'), table)
+
+    def preload(self, name):
+        """Load `name` from the local cache only, without going upstream.
+
+        Returns False if there is no local copy yet, in which case it is
+        fetched on first use (or by the refresher).
+        """
+        with self._lock:
+            if name not in self._snapshots:
+                if not self.cache.has_local(name):
+                    return False
+                self._snapshots[name] = self._load(name, local=True)
+        return True
+
+    def snapshot(self, name):
+        snap = self._snapshot(name)
+        reads = getattr(self._reads, 'versions', None)
+        if reads is not None:
+            reads[name] = snap.version
+        return snap
+
+    def _snapshot(self, name):
+        warming = getattr(self._warming, 'snapshots', None)
+        if warming and name in warming:
+            return warming[name]
+        snap = self._snapshots.get(name)
+        if snap is not None and (self.background or time.time() - snap.checked_at < self.cache.ttl):
+            return snap
+        with self._lock:
+            snap = self._snapshots.get(name)
+            if snap is None or time.time() - snap.checked_at >= self.cache.ttl:
+                self.cache.fetch(name)
+                if snap is not None and snap.version == self.cache.meta(name).get('version'):
+                    snap.checked_at = time.time()
+                else:
+                    snap = self._snapshots[name] = self._load(name)
+        return snap
+
+    def refresh(self, name):
+        """Revalidate `name` upstream and swap in a new snapshot if it changed.
+
+        The new file is mapped in completely before it replaces the old one, so
+        readers only ever see one version or the other. If anything fails the
+        current snapshot stays in place and the error is raised to the caller.
+        """
+        self.cache.fetch(name, force=True)
+        return self._swap(name)
+
+    def refresh_all(self, names, workers=None):
+        """refresh() several datasets, downloading them concurrently (see cache.fetch_all).
+
+        Returns the names that changed and fetch_all's report. Datasets that
+        failed to download keep their current snapshot.
+        """
+        report = self.cache.fetch_all(names, force=True, workers=workers)
+        changed = []
+        for entry in report:
+            if entry['error'] is not None:
+                continue
+            try:
+                if self._swap(entry['name']):
+                    changed.append(entry['name'])
+            except Exception as err:
+                entry['status'], entry['error'] = 'failed', err
+        return changed, report
+
+    def _swap(self, name):
+        old = self._snapshots.get(name)
+        if old is not None and old.version == self.cache.meta(name).get('version'):
+            old.checked_at = time.time()
+            return False
+        snap = self._load(name)
+        # the listeners build what is derived from the new version (indexes, partitions,
+        # smoothing...) before requests can see it: in this thread snapshot(name) is
+        # already the new one, everywhere else still the old one until it is complete
+        if not hasattr(self._warming, 'snapshots'):
+            self._warming.snapshots = {}
+        self._warming.snapshots[name] = snap
+        try:
+            for listener in self._listeners:
+                try:
+                    listener(name, snap)
+                except Exception:
+                    log.exception('refresh listener failed for %s', name)
+        finally:
+            del self._warming.snapshots[name]
+        with self._lock:
+            self._snapshots[name] = snap
+        return True
+
+    def subscribe(self, listener):
+        # listener(name, snapshot) is called with a new snapshot before it is swapped in
+        self._listeners.append(listener)
+        return listener
+
+    def get(self, name):
+        # a shallow copy, so that adding a column only affects the caller's frame
+        return self.snapshot(name).frame.copy(deep=False)
+
+    def derived(self, name, key, build):
+        """build(frame) for the current snapshot of `name`, computed once and kept with it.
+
+        Use this for anything that only depends on the data (sorted indexes,
+        partitions, smoothed series...): it is rebuilt automatically when a
+        refresh swaps in a new version.
+        """
+        return self.memo(name, key, lambda snap: build(snap.frame))
+
+    def memo(self, name, key, build):
+        """Like derived(), but build(snapshot) gets the snapshot, e.g. to use its Arrow table."""
+        snap = self.snapshot(name)
+        kind = key[0] if isinstance(key, tuple) else key
+        try:
+            value = snap.derived[key]
+        except KeyError:
+            count('wwdash_derived_total', kind=kind, result='miss')
+            with stage(kind):
+                value = snap.derived[key] = build(snap)
+            return value
+        count('wwdash_derived_total', kind=kind, result='hit')
+        return value
+
+    def loaded(self):
+        # the datasets that have been asked for so far in this process
+        return list(self._snapshots)
+
+    def version(self, name):
+        return self.snapshot(name).version
+
+    def track(self):
+        # start recording the datasets this thread reads, e.g. for one request (see httpcache.py)
+        self._reads.versions = {}
+
+    def tracked(self):
+        """{name: version} of the datasets this thread read since track(), which stops recording."""
+        versions = getattr(self._reads, 'versions', None)
+        self._reads.versions = None
+        return versions or {}
+
+
+registry = DatasetRegistry()
@@ -0,0 +1,112 @@
+# Lineage prevalence at coarser time resolutions, computed from the daily data.
+#
+# Upstream publishes a monthly and a daily prevalence file; any other
+# resolution would be another file to produce and download. Instead the daily
+# frame of each dataset in ROLLED is rolled up, once per data version, into
+# every resolution in RESOLUTIONS: the mean daily prevalence of each epiweek,
+# month and quarter, scaled so every period adds up to 1. The frame is sorted
+# by date, so each period is a run of consecutive rows and one np.add.reduceat
+# sums all of them at once; quarters are summed from the months rather than
+# from the days again. The result is kept with the snapshot as a small cube
+# of float32 frames, and a figure asks for a resolution with a dict lookup:
+#
+#   rollup('NICD_daily_smoothed', 'epiweek')     # (epiweeks x lineages)
+#
+# lineage_plot (figures.py) uses this for the plottypes in RESOLUTIONS, with
+# the picked dates widened to the labels of the periods they fall in
+# (period_window), so a partial first or last period is shown too.
+
+import numpy as np
+
+from .metrics import timed
+from .registry import registry as default_registry
+from .timeindex import time_indexed
+
+# the daily datasets rollups are made from
+ROLLED = {'NICD_daily_smoothed'}
+
+# resolution -> pandas period frequency. Epiweeks end on Saturday and are labelled by that
+# day, like the 'end' column of the levels data; months and quarters by their first day
+RESOLUTIONS = {
+    'epiweek': 'W-SAT',
+    'monthly': 'M',
+    'quarterly': 'Q',
+}
+
+
+def _periods(index, freq):
+    # the period of every date as an integer, increasing with the date
+    return index.to_period(freq).asi8
+
+
+def _roll(sums, days, periods):
+    # sums and day counts of consecutive rows with the same period, added up
+    starts = np.flatnonzero(np.r_[True, periods[1:] != periods[:-1]])
+    return np.add.reduceat(sums, starts, axis=0), np.add.reduceat(days, starts), starts
+
+
+def _frame(sums, days, labels, columns):
+    # mean prevalence per period, scaled to add up to 1; periods without any are left out
+    import pandas as pd
+    means = sums / days[:, None]
+    totals = means.sum(axis=1)
+    keep = totals > 0
+    values = (means[keep] / totals[keep, None]).astype('float32')
+    return pd.DataFrame(values, index=labels[keep], columns=columns)
+
+
+@timed('rollup')
+def build_cube(frame):
+    """{resolution: (periods x lineages) frame} for a time-sorted daily (dates x lineages) frame."""
+    if not len(frame):
+        return {resolution: frame.iloc[:0] for resolution in RESOLUTIONS}
+    index = frame.index.normalize()
+    # float64 sums, so adding up a quarter's days doesn't lose precision
+    daily = np.nan_to_num(frame.to_numpy(dtype='float64', na_value=np.nan))
+    ones = np.ones(len(index))
+    cube = {}
+
+    sums, days, starts = _roll(daily, ones, _periods(index, RESOLUTIONS['epiweek']))
+    weeks = index[starts].to_period(RESOLUTIONS['epiweek']).end_time.normalize()
+    cube['epiweek'] = _frame(sums, days, weeks, frame.columns)
+
+    sums, days, starts = _roll(daily, ones, _periods(index, RESOLUTIONS['monthly']))
+    months = index[starts].to_period(RESOLUTIONS['monthly']).start_time
+    cube['monthly'] = _frame(sums, days, months, frame.columns)
+
+    # quarters are whole months, so they are rolled up from the month sums
+    sums, days, starts = _roll(sums, days, _periods(months, RESOLUTIONS['quarterly']))
+    quarters = months[starts].to_period(RESOLUTIONS['quarterly']).start_time
+    cube['quarterly'] = _frame(sums, days, quarters, frame.columns)
+    return cube
+
+
+def period_window(resolution, start=None, end=None):
+    """start and end ('YYYY-MM-DD' or None) moved to the labels of the periods they fall in."""
+    import pandas as pd
+    freq = RESOLUTIONS[resolution]
+    # epiweeks are labelled by their last day, months and quarters by their first
+    label = (lambda period: period.end_time.normalize()) if resolution == 'epiweek' \
+        else (lambda period: period.start_time)
+    return tuple(None if date is None else label(pd.Period(date, freq)).strftime('%Y-%m-%d')
+                 for date in (start, end))
+
+
+# the datasets rollup() has been asked for, which _warm rolls up again after a refresh
+_rolled = set()
+
+
+def rollup(name, resolution, registry=None):
+    """Dataset `name` (one of ROLLED) at `resolution` (one of RESOLUTIONS), time-sorted."""
+    registry = registry or default_registry
+    if resolution not in RESOLUTIONS:
+        raise ValueError(f'unknown resolution {resolution!r}, expected one of {", ".join(RESOLUTIONS)}')
+    _rolled.add(name)
+    return registry.memo(name, 'rollup', lambda snap: build_cube(time_indexed(name, registry)))[resolution]
+
+
+@default_registry.subscribe
+def _warm(name, snapshot):
+    # roll up new data in the refresher thread, not in the first request after a refresh
+    if name in _rolled:
+        rollup(name, next(iter(RESOLUTIONS)))
@@ -0,0 +1,73 @@
+# Figure JSON, fast and compact.
+#
+# The lineage charts carry one trace per lineage with hundreds of points
+# each. Written out as JSON lists, every number takes 10-20 characters, and
+# encoding and parsing them dominates a cached response. dumps() writes
+# NumPy arrays as plotly.js typed arrays instead: the raw float32/float64
+# buffer, base64-encoded ({'dtype': 'f4', 'bdata': ...}), which plotly.js
+# reads directly. That is a fraction of the size and no per-number work on
+# either side. The rest of the figure is encoded with orjson if it is
+# installed, and with the standard json module otherwise.
+#
+#   text = dumps(figure)          # a go.Figure or a plain figure dict (see traces.py)
+#   figure = loads(text)          # a plain dict, ready to return from a callback
+
+import base64
+import datetime
+import json
+
+import numpy as np
+
+try:
+    import orjson
+except ImportError:  # optional, the standard json module does the same (slower)
+    orjson = None
+
+# the NumPy dtypes plotly.js has typed arrays for (it has no 64-bit integers)
+TYPED_ARRAYS = {np.dtype(t): code for t, code in (
+    ('float32', 'f4'), ('float64', 'f8'), ('int8', 'i1'), ('uint8', 'u1'),
+    ('int16', 'i2'), ('uint16', 'u2'), ('int32', 'i4'), ('uint32', 'u4'))}
+
+
+def typed_array(array):
+    # little-endian, like plotly.js expects (and every platform we run on)
+    array = np.ascontiguousarray(array)
+    return {'dtype': TYPED_ARRAYS[array.dtype], 'bdata': base64.b64encode(array.data).decode('ascii')}
+
+
+def _default(obj):
+    # whatever orjson / json can't encode by themselves
+    import pandas as pd
+    if isinstance(obj, (pd.Series, pd.Index)):
+        obj = obj.to_numpy()
+    if isinstance(obj, np.ndarray):
+        if obj.dtype in TYPED_ARRAYS and obj.ndim == 1:
+            return typed_array(obj)
+        if np.issubdtype(obj.dtype, np.datetime64):
+            days = obj.astype('datetime64[D]')
+            return np.datetime_as_string(obj, unit='D' if (days == obj).all() else 's').tolist()
+        return obj.tolist()
+    if isinstance(obj, np.generic):
+        return obj.item()
+    if isinstance(obj, (datetime.date, pd.Timestamp)):
+        return obj.isoformat()
+    if hasattr(obj, 'to_plotly_json'):
+        return obj.to_plotly_json()
+    raise TypeError(f'cannot serialize {type(obj).__name__}')
+
+
+def dumps(obj, engine='auto'):
+    """JSON text of a figure (or anything else), with NumPy arrays as typed arrays.
+
+    engine: 'orjson', 'json', or 'auto' for orjson if it is installed.
+    """
+    if hasattr(obj, 'to_plotly_json'):
+        obj = obj.to_plotly_json()
+    if engine == 'orjson' or (engine == 'auto' and orjson is not None):
+        # without OPT_SERIALIZE_NUMPY, arrays go through _default and become typed arrays
+        return orjson.dumps(obj, default=_default, option=orjson.OPT_NON_STR_KEYS).decode()
+    return json.dumps(obj, default=_default, separators=(',', ':'))
+
+
+def loads(text):
+    return orjson.loads(text) if orjson is not None else json.loads(text)
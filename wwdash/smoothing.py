@@ -0,0 +1,171 @@
+# Smoothed series (e.g. the "Smoothed wastewater" line), computed once per data version.
+#
+# bar_chart used to run a centred rolling mean over the filtered levels on
+# every render. smoothed() instead smooths the whole series once per data
+# version, and a figure only takes a window() of the result:
+#
+#   window(smoothed('rsa_cases_vs_levels', 'sum_genomes'), start, end)
+#
+# A refresh usually only appends a few epiweeks (or revises the last ones).
+# The previous input and result are kept, so a new version is compared with
+# the old one and only the part that can have changed is recomputed: the
+# points from the first difference, plus `reach` points before it that look
+# ahead into the changed data. Everything before that is reused as it was.
+#
+# method is one of SMOOTHERS:
+#   rolling      centred mean over `window` points (default 5, as before)
+#   exponential  exponentially weighted mean with `span` (default 4)
+#   loess        local linear fit over the `points` nearest points (default 9)
+
+import logging
+import threading
+
+import numpy as np
+
+from .registry import registry as default_registry
+from .store import DatasetStore, store as default_store
+from .timeindex import time_indexed
+
+log = logging.getLogger(__name__)
+
+
+def rolling_mean(series, window=5):
+    return series.rolling(window=window, min_periods=0, center=True).mean()
+
+
+def exponential(series, span=4):
+    # adjust=False is a plain recursion, s[i] = a * x[i] + (1 - a) * s[i - 1],
+    # so it can be continued from the last smoothed value (see _update)
+    return series.ewm(span=span, adjust=False).mean()
+
+
+def loess(series, points=9):
+    y = series.to_numpy(dtype='float64')
+    n = len(y)
+    k = min(points, n)
+    if k < 3:
+        return series.astype('float64')
+    x = _days(series.index)
+    # the k points around each point (shifted inwards at both ends), as an (n, k) matrix
+    lo = np.clip(np.arange(n) - k // 2, 0, n - k)
+    idx = lo[:, None] + np.arange(k)
+    X, Y = x[idx], y[idx]
+    # tricube weights on the distance, scaled by the farthest point in the window
+    d = np.abs(X - x[:, None])
+    d = d / (d.max(axis=1, keepdims=True) * 1.0001)
+    w = (1 - d ** 3) ** 3
+    # weighted least squares line through each window, evaluated at its point
+    sw = w.sum(axis=1)
+    mx = (w * X).sum(axis=1) / sw
+    my = (w * Y).sum(axis=1) / sw
+    sxx = (w * (X - mx[:, None]) ** 2).sum(axis=1)
+    sxy = (w * (X - mx[:, None]) * (Y - my[:, None])).sum(axis=1)
+    slope = np.divide(sxy, sxx, out=np.zeros(n), where=sxx > 0)
+    import pandas as pd
+    return pd.Series(my + slope * (x - mx), index=series.index, name=series.name)
+
+
+def _days(index):
+    import pandas as pd
+    if isinstance(index, pd.DatetimeIndex):
+        return index.values.astype('datetime64[ns]').astype('int64') / 86400e9
+    return np.asarray(index, dtype='float64')
+
+
+SMOOTHERS = {
+    'rolling': rolling_mean,
+    'exponential': exponential,
+    'loess': loess,
+}
+
+
+def _reach(method, params):
+    # how many points before a change can see it (the look-ahead of the smoother)
+    if method == 'rolling':
+        return params.get('window', 5) // 2
+    if method == 'loess':
+        return params.get('points', 9)
+    return 0
+
+
+def _common_prefix(old, new):
+    m = min(len(old), len(new))
+    same = ((old.index[:m] == new.index[:m])
+            & (old.to_numpy()[:m] == new.to_numpy()[:m]))
+    return m if same.all() else int(same.argmin())
+
+
+def _update(previous, series, method, params):
+    """Smooth `series`, reusing what it shares with the previous (series, smoothed)."""
+    import pandas as pd
+    smooth = SMOOTHERS[method]
+    if previous is None:
+        return smooth(series, **params)
+    old, old_smoothed = previous
+    common = _common_prefix(old, series)
+    if common == len(old) == len(series):
+        return old_smoothed
+    if method == 'exponential':
+        if common == 0:
+            return smooth(series, **params)
+        # restart the recursion from the last unchanged smoothed value
+        seed = pd.Series([old_smoothed.iloc[common - 1]], index=old_smoothed.index[common - 1:common])
+        tail = smooth(pd.concat([seed, series.iloc[common:]]), **params).iloc[1:]
+        start = common
+    else:
+        reach = _reach(method, params)
+        start = max(0, common - reach)
+        # the recomputed points also need `reach` points of input before them
+        context = min(start, reach)
+        tail = smooth(series.iloc[start - context:], **params).iloc[context:]
+    log.debug('smoothing %s: reused %d points, recomputed %d', series.name, start, len(series) - start)
+    return pd.concat([old_smoothed.iloc[:start], tail])
+
+
+# last (input, result) per smoothed() call, across data versions
+_previous = {}
+_previous_lock = threading.Lock()
+
+
+def smoothed(name, column='sum_genomes', method='rolling', partition=None, registry=None, **params):
+    """`column` of a registered dataset, time-sorted, without missing values and smoothed.
+
+    partition: optional (column, value) to smooth one group of the dataset,
+        e.g. ('province', 'Gauteng'), see partition.py.
+    params are passed on to the smoother, e.g. window=7 or span=3.
+    """
+    registry = registry or default_registry
+    key = ('smoothed', column, method, partition, tuple(sorted(params.items())))
+
+    def build(snapshot):
+        if partition is None:
+            source = time_indexed(name, registry)
+        else:
+            # one site, and only the smoothed column, read from the store (see store.py)
+            store = default_store if registry is default_registry else DatasetStore(registry)
+            source = store.query(name, [column], **{partition[0]: partition[1]})
+        series = source[column].dropna()
+        with _previous_lock:
+            previous = _previous.get((name, key), (None, None))[1]
+        result = _update(previous, series, method, params)
+        with _previous_lock:
+            _previous[(name, key)] = ((column, method, partition, registry, params), (series, result))
+        return result
+
+    return registry.memo(name, key, build)
+
+
+def _warm(name, snapshot):
+    # smooth the new version in the refresher thread, for every series that has been asked for
+    with _previous_lock:
+        calls = [args for (dataset, key), (args, _) in _previous.items() if dataset == name]
+    for column, method, partition, registry, params in calls:
+        if registry is default_registry:
+            try:
+                smoothed(name, column, method, partition, registry, **params)
+            except KeyError:
+                # e.g. a province that isn't in the new data anymore
+                pass
+
+
+default_registry.subscribe(_warm)
@@ -0,0 +1,201 @@
+# Partitioned Parquet copies of the per-site datasets, queried with pushdown.
+#
+# The registry hands out whole datasets, and the in-memory partitions
+# (partition.py) sort and copy all of a dataset in every worker. That is fine
+# for nine provinces, but not for hundreds of sewersheds. Datasets listed in
+# STORED are therefore also written, once per data version, as Parquet
+# files partitioned by site (one directory per province) and sorted by time
+# in row groups of ROW_GROUP rows. query() then reads only what a figure
+# needs:
+#   - an equality filter on a partition column skips every other directory;
+#   - a date range skips row groups using their min/max statistics;
+#   - only the requested columns are read.
+#
+#   store.query('provincial_cases_vs_levels', ['end', 'sum_genomes'],
+#               '2024-01-01', '2024-12-31', province='Gauteng')
+#
+# The copy lives in the cache directory (<cache dir>/store/<name>/<version>/)
+# and is written by the first worker that needs it, under the host lock. The
+# previous version is kept for workers still reading it, older ones are
+# removed. Other columns (a pathogen, a site type...) can be filtered on the
+# same way; they just aren't partitioned on. Set WWDASH_STORE=0 to serve the
+# same queries from the in-memory frames instead.
+
+import logging
+import os
+import shutil
+
+import pyarrow as pa
+
+from . import env_flag
+from .metrics import timed
+from .partition import partitioned
+from .registry import registry as default_registry
+from .timeindex import TIME_COLUMNS, sort_by_time, time_indexed, window
+
+log = logging.getLogger(__name__)
+
+# dataset -> the columns its copy is partitioned by. It is sorted by its time column (TIME_COLUMNS)
+STORED = {
+    'provincial_cases_vs_levels': ['province'],
+    'merged_data_exploded': ['province'],
+}
+
+ROW_GROUP = 64 * 1024
+
+ENABLED = env_flag('WWDASH_STORE', default=True)
+
+
+class DatasetStore:
+
+    def __init__(self, registry=None, root=None):
+        self.registry = registry or default_registry
+        self.root = root or os.path.join(self.registry.cache.cache_dir, 'store')
+
+    def enabled(self, name):
+        return ENABLED and name in STORED
+
+    def path(self, name, version):
+        return os.path.join(self.root, name, str(version))
+
+    def dataset(self, name):
+        """The pyarrow dataset for the current version of `name`, written on first use."""
+        return self.registry.memo(name, 'store', lambda snap: self._open(name, snap))
+
+    def _open(self, name, snap):
+        import pyarrow.dataset as ds
+        path = self.path(name, snap.version)
+        if not os.path.isdir(path):
+            with self.registry.cache._host_lock(name + '.store'):
+                if not os.path.isdir(path):
+                    self._write(name, snap.table, path)
+                    self._prune(name, path)
+        return ds.dataset(path, format='parquet', partitioning=_partitioning(STORED[name]))
+
+    @timed('store_write')
+    def _write(self, name, table, path):
+        import pyarrow.compute as pc
+        import pyarrow.dataset as ds
+        partitions, time_column = STORED[name], TIME_COLUMNS[name]
+        for column in partitions:
+            # partition values are directory names, so plain strings (normalize.py made them categoricals)
+            i = table.schema.get_field_index(column)
+            table = table.set_column(i, column, pc.cast(table.column(i), pa.string()))
+        i = table.schema.get_field_index(time_column)
+        if pa.types.is_dictionary(table.schema.field(i).type):
+            # dates kept as categorical strings: stored as plain values, so they can be sorted and compared
+            field = table.schema.field(i)
+            table = table.set_column(i, time_column, pc.cast(table.column(i), field.type.value_type))
+        table = table.sort_by([(c, 'ascending') for c in partitions + [time_column]])
+        tmp = f'{path}.tmp-{os.getpid()}'
+        shutil.rmtree(tmp, ignore_errors=True)
+        ds.write_dataset(table, tmp, format='parquet', partitioning=_partitioning(partitions),
+                         max_rows_per_group=ROW_GROUP, min_rows_per_group=min(ROW_GROUP, table.num_rows) or 1,
+                         existing_data_behavior='overwrite_or_ignore')
+        os.replace(tmp, path)
+        log.info('wrote the partitioned copy of %s (%d rows)', name, table.num_rows)
+
+    def _prune(self, name, current):
+        # keep the current and the previous version, which other workers may still be reading
+        directory = os.path.dirname(current)
+        versions = sorted((os.path.join(directory, v) for v in os.listdir(directory)
+                           if os.path.join(directory, v) != current), key=os.path.getmtime)
+        for old in versions[:-1]:
+            shutil.rmtree(old, ignore_errors=True)
+
+    @timed('query')
+    def query(self, name, columns=None, start=None, end=None, **equals):
+        """Rows of `name` with start <= date <= end and column == value for each keyword.
+
+        Returns a time-sorted frame like time_indexed(name) (see timeindex.py),
+        with only `columns` (and the time column) if given.
+        """
+        if not self.enabled(name):
+            return self._query_frame(name, columns, start, end, equals)
+        import pyarrow.dataset as ds
+        time_column = TIME_COLUMNS[name]
+        dataset = self.dataset(name)
+        time_type = dataset.schema.field(time_column).type
+        condition = None
+        for column, value in equals.items():
+            condition = _and(condition, ds.field(column) == value)
+        if start is not None:
+            condition = _and(condition, ds.field(time_column) >= _time(start, time_type))
+        if end is not None:
+            condition = _and(condition, ds.field(time_column) <= _time(end, time_type))
+        if columns is not None:
+            columns = list(dict.fromkeys(list(columns) + [time_column]))
+        table = dataset.to_table(columns=columns, filter=condition)
+        return sort_by_time(table.to_pandas(), time_column)
+
+    def _query_frame(self, name, columns, start, end, equals):
+        # the same query on the registry's in-memory frame: a partition for the first
+        # partition column, a mask for anything else
+        frame = None
+        for column, value in equals.items():
+            if frame is None and column in STORED.get(name, ()):
+                frame = partitioned(name, column, self.registry).get(value)
+                if frame is None:
+                    frame = time_indexed(name, self.registry).iloc[:0]
+            else:
+                frame = time_indexed(name, self.registry) if frame is None else frame
+                frame = frame[frame[column] == value]
+        frame = window(time_indexed(name, self.registry) if frame is None else frame, start, end)
+        if columns is not None:
+            columns = dict.fromkeys(list(columns) + [TIME_COLUMNS.get(name)])
+            frame = frame[[c for c in columns if c in frame.columns]]
+        return frame
+
+    def values(self, name, column):
+        """The distinct values of partition column `column`, without reading any data."""
+        if not self.enabled(name):
+            return list(partitioned(name, column, self.registry))
+        import pyarrow.dataset as ds
+
+        def build(snap):
+            fragments = self.dataset(name).get_fragments()
+            return sorted({ds.get_partition_keys(f.partition_expression)[column] for f in fragments})
+        return self.registry.memo(name, ('store_values', column), build)
+
+    def bounds(self, name):
+        """The first and last date in `name`, as Timestamps."""
+        if not self.enabled(name):
+            dates = time_indexed(name, self.registry).index
+            return dates[0], dates[-1]
+        import pyarrow.compute as pc
+        time_column = TIME_COLUMNS[name]
+
+        def build(snap):
+            import pandas as pd
+            # only the time column is read
+            extremes = pc.min_max(self.dataset(name).to_table(columns=[time_column]).column(0))
+            return pd.Timestamp(extremes['min'].as_py()), pd.Timestamp(extremes['max'].as_py())
+        return self.registry.memo(name, ('store_bounds', time_column), build)
+
+
+def _partitioning(columns):
+    import pyarrow.dataset as ds
+    return ds.partitioning(pa.schema([(c, pa.string()) for c in columns]), flavor='hive')
+
+
+def _and(condition, other):
+    return other if condition is None else condition & other
+
+
+def _time(value, time_type):
+    # a date bound in the type of the time column: 'YYYY-MM-DD' strings (which sort
+    # like dates) or timestamps
+    import pandas as pd
+    if pa.types.is_string(time_type) or pa.types.is_large_string(time_type):
+        return pd.Timestamp(value).strftime('%Y-%m-%d')
+    return pa.scalar(pd.Timestamp(value), type=time_type)
+
+
+store = DatasetStore()
+
+
+@default_registry.subscribe
+def _warm(name, snapshot):
+    # write the new version's copy in the refresher thread, not in the first request after a refresh
+    if store.enabled(name):
+        store.dataset(name)
@@ -0,0 +1,78 @@
+# Date range queries on a sorted time index.
+#
+# Filtering with boolean masks (df[df['end'] >= start], then <= end) scans
+# and copies the frame twice per query. Instead each dataset gets a sorted
+# DatetimeIndex once per data version (registry.derived), and a date range
+# is two binary searches and a positional slice, which doesn't copy the data:
+#
+#   df = time_indexed('rsa_cases_vs_levels')
+#   window(df, '2024-06-01', '2024-12-01')
+
+
+from .metrics import timed
+from .registry import registry as default_registry
+
+# datasets whose dates are in a column rather than the index
+TIME_COLUMNS = {
+    'rsa_cases_vs_levels': 'end',
+    'provincial_cases_vs_levels': 'end',
+    'merged_data_exploded': 'date',
+}
+
+
+def sort_by_time(frame, column=None):
+    """`frame` with a sorted DatetimeIndex, taken from `column` if given.
+
+    The column is kept too (as datetimes), since the figures plot it.
+    """
+    import pandas as pd
+    frame = frame.copy(deep=False)
+    if column is not None:
+        times = pd.DatetimeIndex(pd.to_datetime(frame[column]))
+        frame[column] = times
+        frame.index = times.rename(None)
+    elif not isinstance(frame.index, pd.DatetimeIndex):
+        frame.index = pd.DatetimeIndex(pd.to_datetime(frame.index))
+    if not frame.index.is_monotonic_increasing:
+        frame = frame.sort_index(kind='stable')
+    return frame
+
+
+# the datasets time_indexed() has been asked for, which _warm keeps indexed
+_indexed = set()
+
+
+def time_indexed(name, registry=None):
+    registry = registry or default_registry
+    column = TIME_COLUMNS.get(name)
+    _indexed.add(name)
+    return registry.derived(name, ('time_indexed', column), lambda frame: sort_by_time(frame, column))
+
+
+@timed('filter')
+def window(frame, start=None, end=None):
+    """Rows of a time-sorted frame with start <= date <= end (either may be None)."""
+    import pandas as pd
+    index = frame.index
+    lo = index.searchsorted(pd.Timestamp(start), side='left') if start is not None else 0
+    hi = index.searchsorted(pd.Timestamp(end), side='right') if end is not None else len(index)
+    return frame.iloc[lo:hi]
+
+
+def day(value, default=None):
+    # 'YYYY-MM-DD' for a date picker value (which may carry a time), for cache keys
+    if value is None:
+        return default
+    import pandas as pd
+    return pd.Timestamp(value).strftime('%Y-%m-%d')
+
+
+def _warm(name, snapshot):
+    # build the index in the refresher thread rather than in the first request after a refresh
+    # (only for datasets that were used that way, the others need not become a frame at all)
+    if name in _indexed:
+        column = TIME_COLUMNS.get(name)
+        snapshot.derived[('time_indexed', column)] = sort_by_time(snapshot.frame, column)
+
+
+default_registry.subscribe(_warm)
@@ -0,0 +1,59 @@
+# Fast construction of stacked lineage prevalence charts.
+#
+# Building one go.Bar / go.Scatter per lineage runs Plotly's property
+# validation for every trace, which dominates seq_plot once there are a few
+# hundred lineages. Here all traces are made in one go from a single 2D NumPy
+# array as plain dicts, which are valid plotly.js input and need no
+# validation. The layout is still built with the usual go.Figure /
+# update_layout calls (validated once, its size doesn't grow with the data)
+# and the two are put together with figure_dict():
+#
+#   fig = go.Figure()
+#   fig.update_layout(barmode='stack', ...)
+#   return figure_dict(fig, stacked_traces(seq_df, colors, kind='bar'))
+#
+# Dash, the figure cache and plotly.io.to_json accept the result like a Figure.
+
+import numpy as np
+
+from .metrics import timed
+
+
+def _x_values(index):
+    import pandas as pd
+    if isinstance(index, pd.DatetimeIndex):
+        # one vectorized conversion, shared by every trace
+        if (index == index.normalize()).all():
+            return np.datetime_as_string(index.values, unit='D')
+        return np.datetime_as_string(index.values, unit='s')
+    return np.asarray(index)
+
+
+@timed('traces')
+def stacked_traces(frame, colors, kind='bar'):
+    """One trace per column of `frame`, stacked, as plotly.js dicts.
+
+    colors is a sequence with one color per column (e.g.
+    color_map.reindex(frame.columns)). kind='bar' gives stacked bars and
+    kind='area' stacked areas, matching seq_plot's monthly and daily views.
+    """
+    x = _x_values(frame.index)
+    # one row per lineage; each trace's y is a view into this array. float32 prevalences
+    # (see normalize.py) stay float32, which serialize.py sends as half as many bytes
+    dtype = 'float32' if len(frame.columns) and (frame.dtypes == 'float32').all() else 'float64'
+    y = np.ascontiguousarray(frame.to_numpy(dtype=dtype, na_value=np.nan).T)
+    names = [str(c) for c in frame.columns]
+    if kind == 'bar':
+        return [{'type': 'bar', 'name': name, 'x': x, 'y': y[i], 'marker': {'color': color}}
+                for i, (name, color) in enumerate(zip(names, colors))]
+    if kind == 'area':
+        return [{'type': 'scatter', 'name': name, 'x': x, 'y': y[i], 'mode': 'lines',
+                 'stackgroup': 'one', 'fillcolor': color, 'marker': {'color': color},
+                 'line': {'width': 0.0}}
+                for i, (name, color) in enumerate(zip(names, colors))]
+    raise ValueError(f'unknown kind {kind!r}, expected "bar" or "area"')
+
+
+def figure_dict(fig, traces):
+    """Combine a (trace-less) go.Figure's layout with prebuilt trace dicts."""
+    return {'data': traces, 'layout': fig.layout.to_plotly_json()}